@@ -20,10 +20,26 @@ def berry_curvature(H,kx,ky,mu,d=10**-6):
         result: float
             The calculated Berry curvature for function H at point kx,ky with chemical potential mu.
     '''
-    result=0
     Vx=(H(kx+d,ky)-H(kx-d,ky))/(2*d)
     Vy=(H(kx,ky+d)-H(kx,ky-d))/(2*d)
-    Es,Evs=eigh(H(kx,ky))
+    return berry_curvature_kubo(H(kx,ky),Vx,Vy,mu)
+
+def berry_curvature_kubo(H,Vx,Vy,mu):
+    '''
+    This function calculates the Berry curature of the occupied bands using the Kubo formula from the Hamiltonian and its derivatives at a given point.
+    Parameters:
+        H: 2D ndarray
+            The Hamiltonian.
+        Vx,Vy: 2D ndarray
+            The derivatives of the Hamiltonian with respect to kx and ky.
+        mu: float
+            The chemical potential.
+    Returns:
+        result: float
+            The calculated Berry curvature.
+    '''
+    result=0
+    Es,Evs=eigh(H)
     for n in xrange(Es.shape[0]):
         for m in xrange(Es.shape[0]):
             if Es[n]<=mu and Es[m]>mu:
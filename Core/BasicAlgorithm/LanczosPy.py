@@ -3,14 +3,15 @@ Lanczos.
 '''
 from numpy import *
 from scipy.sparse import csr_matrix
-from scipy.linalg import eigh
+from scipy.linalg import eigh,svd
 from numpy.linalg import norm
 class Lanczos:
     '''
     The Lanczos algorithm to deal with csr-formed sparse Hermitian matrices.
     Attributes:
-        matrix: csr_matrix
+        matrix: csr_matrix or LinearOperator
             The csr-formed sparse Hermitian matrix.
+            Only matrix.dot and matrix.shape are used, so a matrix-free LinearOperator works as well.
         zero: float
             The precision used to cut off the Lanczos iterations.
         new,old: 1D ndarray
@@ -24,7 +25,7 @@ class Lanczos:
         '''
         Constructor.
         Parameters:
-            matrix: csr_matrix
+            matrix: csr_matrix or LinearOperator
                 The csr-formed sparse Hermitian matrix.
             vector: 1D ndarray,optional
                 The initial vector to begin with the Lanczos iterations. 
@@ -128,3 +129,172 @@ class Lanczos:
             return gse,gs
         else:
             return gse
+
+class BlockLanczos:
+    '''
+    The block Lanczos algorithm to deal with csr-formed sparse Hermitian matrices.
+    Starting from a block of p vectors, it generates the block tridiagonal representation of the matrix, whose diagonal blocks are a[k] and whose sub-diagonal blocks are b[k]:
+        matrix.dot(Q_k)=Q_{k-1}.dot(b[k-1]^dagger)+Q_k.dot(a[k])+Q_{k+1}.dot(b[k]).
+    When the block of residual vectors becomes linearly dependent, the dependent directions are deflated, i.e. replaced by zero vectors, so that the block size effectively shrinks while the shapes of all the blocks stay p*p.
+    Attributes:
+        matrix: csr_matrix or LinearOperator
+            The csr-formed sparse Hermitian matrix.
+        zero: float
+            The precision used to deflate the Lanczos vectors and to cut off the Lanczos iterations.
+        new,old: 2D ndarray
+            The new and old blocks of vectors updated in the Lanczos iterations, whose columns are the Lanczos vectors.
+        r0: 2D ndarray
+            The coefficients of the initial vectors in the first block of Lanczos vectors, i.e. vectors=new.dot(r0) at the beginning.
+        a,b: 1D list of 2D ndarray
+            The block coefficients calculated in the Lanczos iterations.
+        cut: logical
+            A flag to tag whether the iteration has been cut off.
+    '''
+    def __init__(self,matrix,vectors,zero=10**-10,dtype=complex128):
+        '''
+        Constructor.
+        Parameters:
+            matrix: csr_matrix or LinearOperator
+                The csr-formed sparse Hermitian matrix.
+            vectors: 2D ndarray
+                The initial vectors to begin with the Lanczos iterations, whose columns are the vectors.
+                They need not be orthonormal.
+            zero: float,optional
+                The precision used to deflate the Lanczos vectors and to cut off the Lanczos iterations.
+            dtype: dtype,optional
+                The data type of the iterated vectors.
+        '''
+        self.matrix=matrix
+        self.zero=zero
+        self.new,self.r0=self.orthonormalize(asarray(vectors,dtype=dtype))
+        self.old=zeros_like(self.new)
+        self.cut=norm(self.r0)<=self.zero
+        self.a=[]
+        self.b=[]
+
+    def orthonormalize(self,vectors):
+        '''
+        This method decomposes a block of vectors into an orthonormal block with deflated directions set to zero and a square coefficient matrix.
+        Parameters:
+            vectors: 2D ndarray
+                The block of vectors.
+        Returns:
+            q: 2D ndarray
+                The orthonormal block of vectors, whose linearly dependent directions are replaced by zero vectors.
+            r: 2D ndarray
+                The coefficient matrix which satisfies vectors=q.dot(r).
+        '''
+        nvector=vectors.shape[1]
+        q=zeros_like(vectors)
+        r=zeros((nvector,nvector),dtype=vectors.dtype)
+        u,s,vh=svd(vectors,full_matrices=False,check_finite=False)
+        n=sum(s>self.zero)
+        q[:,0:n]=u[:,0:n]
+        r[0:n,:]=s[0:n,newaxis]*vh[0:n,:]
+        return q,r
+
+    def iter(self):
+        '''
+        The block Lanczos iteration.
+        '''
+        count=len(self.a)
+        buff=self.matrix.dot(self.new)
+        self.a.append(dot(self.new.T.conjugate(),buff))
+        buff[...]=buff-dot(self.new,self.a[count])
+        if count>0:
+            buff[...]=buff-dot(self.old,self.b[count-1].T.conjugate())
+        q,r=self.orthonormalize(buff)
+        self.b.append(r)
+        self.old[...]=self.new
+        self.new[...]=q
+        if norm(r)<=self.zero: self.cut=True
+
+def trlanczos(matrix,k=1,nkrylov=30,vector=None,vtype='rd',reorth='full',tol=10**-10,maxiter=1000,dtype=complex128):
+    '''
+    The thick-restart Lanczos algorithm to find the lowest eigenpairs of a sparse Hermitian matrix with a bounded memory.
+    At most nkrylov+1 vectors are stored. When the Krylov space is full, it is contracted to the lowest Ritz vectors plus the residual vector, whose projected matrix has an arrow form, and the iteration goes on from there.
+    When an invariant subspace is met, e.g. for a degenerate lowest level seen from a single start vector, the iteration goes on with a random vector orthogonal to the current Krylov space, so that the whole degenerate multiplet can be found.
+    Parameters:
+        matrix: csr_matrix or LinearOperator
+            The csr-formed sparse Hermitian matrix.
+        k: integer, optional
+            The number of the wanted lowest eigenpairs.
+        nkrylov: integer, optional
+            The maximum dimension of the Krylov space, which must be at least k+2.
+        vector: 1D ndarray, optional
+            The initial vector.
+        vtype: string, optional
+            A flag to tell what type of initial vectors to use when the parameter vector is None.
+            'rd' means a random vector while 'sy' means a symmetric vector.
+        reorth: string, optional
+            'full' for the full reorthogonalization against all the Krylov vectors and 'selective' for the reorthogonalization only against the kept Ritz vectors.
+        tol: float, optional
+            The relative precision of the residuals of the eigenpairs.
+        maxiter: integer, optional
+            The maximum number of restarts.
+        dtype: dtype, optional
+            The data type of the Krylov vectors.
+    Returns:
+        w: 1D ndarray
+            The lowest k eigenvalues in the ascending order.
+        v: 2D ndarray
+            The corresponding eigenvectors, with v[:,i] for w[i].
+        info: dict
+            The convergence information, with the entries:
+            'converged': whether all the k eigenpairs have converged;
+            'residuals': the residual norms of the k eigenpairs;
+            'nrestart': the number of restarts;
+            'nmatvec': the number of matrix-vector multiplications.
+    '''
+    ndim=matrix.shape[0]
+    m=min(nkrylov,ndim)
+    if m<ndim and m<k+2:
+        raise ValueError('trlanczos error: nkrylov(%s) must be at least k+2(%s).'%(nkrylov,k+2))
+    k=min(k,m)
+    V=zeros((ndim,m+1),dtype=dtype)
+    T=zeros((m,m))
+    if vector is None:
+        if vtype.lower()=='rd':
+            V[:,0]=random.rand(ndim)
+        else:
+            V[:,0]=1.0
+    else:
+        V[:,0]=vector
+    V[:,0]=V[:,0]/norm(V[:,0])
+    nkeep,nrestart,nmatvec,beta=0,0,0,0.0
+    while True:
+        for j in xrange(nkeep,m):
+            w=matrix.dot(V[:,j])
+            nmatvec+=1
+            T[j,j]=vdot(V[:,j],w).real
+            lo=0 if j==nkeep else j-1
+            w-=dot(V[:,lo:j+1],T[lo:j+1,j])
+            if reorth=='full':
+                for count in xrange(2):
+                    w-=dot(V[:,0:j+1],dot(V[:,0:j+1].T.conjugate(),w))
+            elif nkeep>0:
+                w-=dot(V[:,0:nkeep],dot(V[:,0:nkeep].T.conjugate(),w))
+            beta=norm(w)
+            if beta<=tol*max(1.0,abs(T[j,j])) and j<ndim-1:
+                beta=0.0
+                w=random.rand(ndim).astype(dtype)
+                for count in xrange(2):
+                    w-=dot(V[:,0:j+1],dot(V[:,0:j+1].T.conjugate(),w))
+                w=w/norm(w)
+            else:
+                w=w/beta if beta>0 else w
+            if j<m-1:
+                T[j,j+1]=T[j+1,j]=beta
+            V[:,j+1]=w
+        theta,Y=eigh(T)
+        residuals=abs(beta*Y[m-1,0:k])
+        converged=all(residuals<=tol*maximum(1.0,abs(theta[0:k]))) or m==ndim
+        if converged or nrestart>=maxiter:
+            return theta[0:k],dot(V[:,0:m],Y[:,0:k]),{'converged':converged,'residuals':residuals,'nrestart':nrestart,'nmatvec':nmatvec}
+        nkeep=max(k,min(m-2,k+(m-k)/2))
+        V[:,0:nkeep]=dot(V[:,0:m],Y[:,0:nkeep])
+        V[:,nkeep]=V[:,m]
+        T[...]=0.0
+        T[range(nkeep),range(nkeep)]=theta[0:nkeep]
+        T[0:nkeep,nkeep]=T[nkeep,0:nkeep]=beta*Y[m-1,0:nkeep]
+        nrestart+=1
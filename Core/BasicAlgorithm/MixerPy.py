@@ -0,0 +1,146 @@
+'''
+Mixers for self-consistent iterations.
+'''
+from numpy import *
+from numpy.linalg import norm,lstsq
+class Mixer:
+    '''
+    The linear mixer, x_new=x+alpha*r, which is also the base class of the mixers which propose the next input of a fixed-point iteration x=F(x) from the current input x and its residual r=F(x)-x.
+    Attributes:
+        alpha: float
+            The mixing parameter, i.e. the weight of the residual in the next input.
+        residuals: list of 1D ndarray
+            The absolute values of the residuals of every component in every iteration.
+    '''
+    def __init__(self,alpha=0.5):
+        '''
+        Constructor.
+        Parameters:
+            alpha: float, optional
+                The mixing parameter.
+        '''
+        self.alpha=alpha
+        self.residuals=[]
+
+    def __call__(self,x,r):
+        '''
+        Record the residual and return the next input.
+        Parameters:
+            x: 1D ndarray
+                The current input.
+            r: 1D ndarray
+                The residual F(x)-x of the current input.
+        Returns:
+            result: 1D ndarray
+                The next input.
+        '''
+        x,r=asarray(x),asarray(r)
+        self.residuals.append(abs(r))
+        return self.mix(x,r)
+
+    def mix(self,x,r):
+        '''
+        Return the next input, which is the linear mixing here and is overridden by the inheriting classes.
+        '''
+        return x+self.alpha*r
+
+    def reset(self):
+        '''
+        Clear the history of the mixer.
+        '''
+        self.residuals=[]
+
+class AndersonMixer(Mixer):
+    '''
+    The Anderson mixer, also known as Pulay mixing or DIIS.
+    The next input is the linear mixing of the combination of the recent inputs whose combined residual is minimal in the least square sense.
+    Attributes:
+        nhistory: integer
+            The maximum number of the recent iterations kept in the history.
+        xs,rs: list of 1D ndarray
+            The recent inputs and residuals.
+    '''
+    def __init__(self,alpha=0.5,nhistory=5):
+        '''
+        Constructor.
+        Parameters:
+            alpha: float, optional
+                The mixing parameter.
+            nhistory: integer, optional
+                The maximum number of the recent iterations kept in the history.
+        '''
+        Mixer.__init__(self,alpha=alpha)
+        self.nhistory=nhistory
+        self.xs=[]
+        self.rs=[]
+
+    def mix(self,x,r):
+        self.xs.append(x.copy())
+        self.rs.append(r.copy())
+        if len(self.xs)>self.nhistory+1:
+            self.xs.pop(0)
+            self.rs.pop(0)
+        if len(self.xs)==1:
+            return x+self.alpha*r
+        dxs=array([self.xs[i+1]-self.xs[i] for i in xrange(len(self.xs)-1)]).T
+        drs=array([self.rs[i+1]-self.rs[i] for i in xrange(len(self.rs)-1)]).T
+        gamma=lstsq(drs,r,rcond=-1)[0]
+        return x+self.alpha*r-dot(dxs+self.alpha*drs,gamma)
+
+    def reset(self):
+        Mixer.reset(self)
+        self.xs=[]
+        self.rs=[]
+
+class BroydenMixer(Mixer):
+    '''
+    The Broyden mixer based on the second Broyden method, which updates an approximation H of the inverse Jacobian of the residual.
+    The initial approximation is -alpha*I, i.e. the linear mixing, and the history is restarted from it when it is full.
+    Attributes:
+        nhistory: integer
+            The maximum number of the rank-1 updates before a restart.
+        us,vs: list of 1D ndarray
+            The rank-1 updates, H=-alpha*I+sum_i us[i]*vs[i]^dagger.
+        x,r: 1D ndarray
+            The last input and residual.
+    '''
+    def __init__(self,alpha=0.5,nhistory=10):
+        '''
+        Constructor.
+        Parameters:
+            alpha: float, optional
+                The mixing parameter.
+            nhistory: integer, optional
+                The maximum number of the rank-1 updates before a restart.
+        '''
+        Mixer.__init__(self,alpha=alpha)
+        self.nhistory=nhistory
+        self.us=[]
+        self.vs=[]
+        self.x=None
+        self.r=None
+
+    def inverse_jacobian(self,r):
+        '''
+        Apply the approximated inverse Jacobian onto a vector.
+        '''
+        result=-self.alpha*r
+        for u,v in zip(self.us,self.vs):
+            result=result+u*vdot(v,r)
+        return result
+
+    def mix(self,x,r):
+        if self.x is not None:
+            dx,dr=x-self.x,r-self.r
+            if norm(dr)>0:
+                if len(self.us)>=self.nhistory:
+                    self.us,self.vs=[],[]
+                self.us.append(dx-self.inverse_jacobian(dr))
+                self.vs.append(dr/vdot(dr,dr).real)
+        self.x,self.r=x.copy(),r.copy()
+        return x-self.inverse_jacobian(r)
+
+    def reset(self):
+        Mixer.reset(self)
+        self.us,self.vs=[],[]
+        self.x,self.r=None,None
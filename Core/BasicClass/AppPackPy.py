@@ -120,11 +120,26 @@ class GFC(App):
     '''
     The coefficients of Green's functions.
     '''
-    def __init__(self,nstep=200,vtype='rd',**karg):
+    def __init__(self,nstep=200,vtype='rd',method='S',**karg):
+        '''
+        Constructor.
+        Parameters:
+            nstep: integer, optional
+                The number of Lanczos iterations.
+            vtype: string, optional
+                The type of the initial vector used to find the ground state, 'rd' for random and 'sy' for symmetric.
+            method: string, optional
+                'S' for one scalar Lanczos chain per matrix element of the Green's function,
+                'B' for one block Lanczos chain for all of them, and
+                'Q' for the block Lanczos chain diagonalized once into the Q-matrix form, i.e. G(omega)=Q*(omega-poles)^(-1)*Q^dagger.
+        '''
         self.nstep=nstep
         self.vtype=vtype
+        self.method=method
         self.gse=0
         self.coeff=array([])
+        self.Q=array([])
+        self.poles=array([])
 
 class GF(App):
     '''
@@ -2,7 +2,7 @@
 BaseSpace, including KSpace and TSpace.
 '''
 from BasicGeometryPy import *
-from numpy.linalg import inv
+from numpy.linalg import inv,pinv
 from collections import OrderedDict
 import matplotlib.pyplot as plt
 import itertools
@@ -10,13 +10,16 @@ class BaseSpace:
     '''
     This class provides a unified description of all kinds of parameter spaces.
     Attibutes:
-        mesh: OrderedDict with its keys being any hashable object and values being ndarray
+        mesh: OrderedDict with its keys being any hashable object and values being ndarray or LazyMesh
             The mesh of the parameter space.
             Its keys represent the name of the parameter space when its length ==1 or the tags of different parameter axis when its length >1.
             Its values contain the corresponding meshes.
         volume: OrderedDict with its keys being any hashable object and values being float
             The volume of the parameter space. 
             This attribute is not always initialized or used.
+        weights: OrderedDict with its keys being any hashable object and values being 1D ndarray of integers
+            The weights of the mesh points, i.e. the numbers of the points they represent.
+            None for a mesh whose points are equally weighted.
     '''
     def __init__(self,*paras):
         '''
@@ -30,12 +33,16 @@ class BaseSpace:
                         The corresponding mesh.
                     Entry 'volume': float, optional
                         The corresponding volume.
+                    Entry 'weight': 1D ndarray of integers, optional
+                        The corresponding weights.
         '''
         self.mesh=OrderedDict()
         self.volume=OrderedDict()
+        self.weights=OrderedDict()
         for para in paras:
             self.mesh[para['tag']]=para['mesh'] if 'mesh' in para else None
             self.volume[para['tag']]=para['volume'] if 'volume' in para else None
+            self.weights[para['tag']]=para['weight'] if 'weight' in para else None
 
     def __str__(self):
         '''
@@ -70,6 +77,22 @@ class BaseSpace:
         '''
         return {key:self.mesh[key].shape[0] for key in self.mesh.keys()}
 
+    def weight(self,key=None):
+        '''
+        This method returns the weights of the points in the base space.
+        Parameters:
+            key: any hashable object, optional
+                The tag of the mesh whose weights are returned.
+                When it is None, the weights of the points yielded by self('*') are returned.
+        Returns:
+            result: 1D ndarray of integers
+                The weights, all ones for a mesh whose weights are None.
+        '''
+        if key is None:
+            return reduce(multiply.outer,[self.weight(key) for key in self.mesh.keys()]).ravel()
+        else:
+            return ones(self.mesh[key].shape[0],dtype=int64) if self.weights[key] is None else self.weights[key]
+
     def plot(self,show=True,name='BaseSpace'):
         '''
         Plot the points contained in its mesh. 
@@ -86,11 +109,89 @@ class BaseSpace:
                 plt.savefig(name+'_'+key+'.png')
         plt.close()
 
-def KSpace(reciprocals=None,nk=100,mesh=None,volume=0.0):
+class LazyMesh(object):
+    '''
+    A mesh whose points are generated on demand chunk by chunk instead of being stored.
+    It can be sliced and iterated over like a 2D ndarray, and it is converted to one by asarray.
+    Attributes:
+        function: callable
+            function(seqs) returns the points whose flat indices are seqs as a 2D ndarray.
+        npoint: integer
+            The number of points.
+        ndim: integer
+            The dimension of the points.
+        nchunk: integer
+            The number of points generated at a time when the mesh is iterated over.
+    '''
+    def __init__(self,function,npoint,ndim,nchunk=10**4):
+        '''
+        Constructor.
+        Parameters:
+            function: callable
+                The generator of the points.
+            npoint: integer
+                The number of points.
+            ndim: integer
+                The dimension of the points.
+            nchunk: integer, optional
+                The number of points generated at a time.
+        '''
+        self.function=function
+        self.npoint=npoint
+        self.ndim=ndim
+        self.nchunk=nchunk
+
+    @property
+    def shape(self):
+        '''
+        The shape of the mesh.
+        '''
+        return (self.npoint,self.ndim)
+
+    def __len__(self):
+        '''
+        The number of points.
+        '''
+        return self.npoint
+
+    def __getitem__(self,index):
+        '''
+        Only the requested points are generated when index is an integer or a slice.
+        '''
+        if isinstance(index,slice):
+            return self.function(arange(*index.indices(self.npoint)))
+        elif asarray(index).ndim==0:
+            return self.function(array([index%self.npoint]))[0]
+        else:
+            return asarray(self)[index]
+
+    def __iter__(self):
+        '''
+        Iterate over the points.
+        '''
+        for chunk in self.chunks():
+            for point in chunk:
+                yield point
+
+    def __array__(self,dtype=None):
+        '''
+        Generate the whole mesh.
+        '''
+        result=self.function(arange(self.npoint))
+        return result if dtype is None else result.astype(dtype)
+
+    def chunks(self):
+        '''
+        Iterate over the chunks of the mesh.
+        '''
+        for i in xrange(0,self.npoint,self.nchunk):
+            yield self.function(arange(i,min(i+self.nchunk,self.npoint)))
+
+def KSpace(reciprocals=None,nk=100,mesh=None,volume=0.0,nchunk=None):
     '''
     This function returns a BaseSpace instance that represents the whole Broullouin zone(BZ), a path in the BZ, or just some isolated points in the BZ.
     It can be used in the following ways:
-        1) KSpace(reciprocals=...,nk=...)
+        1) KSpace(reciprocals=...,nk=...,nchunk=...)
         2) KSpace(mesh=...,volume=...)
     Parameters:
         reciprocals: list of 1D ndarrays, optional
@@ -102,6 +203,8 @@ def KSpace(reciprocals=None,nk=100,mesh=None,volume=0.0):
         volume: float, optional
             The volume of the BZ.
             When the parameter reciprocals is not None, it is omitted since the volume of the BZ will be calculated by the reciprocals.
+        nchunk: integer, optional
+            When it is not None, the mesh of the BZ is a LazyMesh generated nchunk points at a time.
     '''
     result=BaseSpace({'tag':'k','mesh':mesh,'volume':volume})
     if reciprocals is not None:
@@ -114,24 +217,29 @@ def KSpace(reciprocals=None,nk=100,mesh=None,volume=0.0):
             result.volume['k']=abs(volume(reciprocals[0],reciprocals[1],reciprocals[2]))
         else:
             raise ValueError("KSpace error: the number of reciprocals should not be greater than 3.")
-        ndim=reciprocals[0].shape[0]
-        ubi=1;ubj=1;ubk=1
-        if nvectors>=1:ubi=nk
-        if nvectors>=2:ubj=nk
-        if nvectors>=3:ubk=nk
-        result.mesh['k']=zeros((ubi*ubj*ubk,ndim))
-        for i in xrange(ubi):
-            for j in xrange(ubj):
-                for k in xrange(ubk):
-                    for l in xrange(ndim):
-                        for h in xrange(nvectors):
-                            if h==0: buff=1.0*i/ubi-0.5
-                            if h==1: buff=1.0*j/ubj-0.5
-                            if h==2: buff=1.0*k/ubk-0.5
-                            result.mesh['k'][(i*ubj+j)*ubk+k,l]=result.mesh['k'][(i*ubj+j)*ubk+k,l]+reciprocals[h][l]*buff
+        recips=array(reciprocals)
+        function=lambda seqs: kspace_mesh(recips,nk,seqs)
+        result.mesh['k']=function(arange(nk**nvectors)) if nchunk is None else LazyMesh(function,nk**nvectors,recips.shape[1],nchunk)
     return result
 
-def line_1d(reciprocals=None,nk=100):
+def kspace_mesh(reciprocals,nk,seqs):
+    '''
+    This function returns some points of the uniform mesh of the BZ.
+    Parameters:
+        reciprocals: 2D ndarray
+            The unit translation vectors of the BZ, row by row.
+        nk: integer
+            The number of mesh points along each unit translation vector.
+        seqs: 1D ndarray of integers
+            The flat indices of the points, the index of the last unit translation vector varying fastest.
+    Returns:
+        result: 2D ndarray
+            The coordinates of the points, row by row.
+    '''
+    fractions=array(unravel_index(seqs,(nk,)*reciprocals.shape[0]),dtype=float64).reshape((reciprocals.shape[0],-1)).T/nk-0.5
+    return dot(fractions,reciprocals)
+
+def line_1d(reciprocals=None,nk=100,nchunk=None):
     '''
     The BZ of 1D K-space.
     '''
@@ -139,7 +247,7 @@ def line_1d(reciprocals=None,nk=100):
         recips=[array([2*pi])]
     else:
         recips=reciprocals
-    return KSpace(reciprocals=recips,nk=nk)
+    return KSpace(reciprocals=recips,nk=nk,nchunk=nchunk)
 
 def rectangle_gxm(reciprocals=None,nk=100):
     '''
@@ -179,7 +287,7 @@ def rectangle_gym(reciprocals=None,nk=100):
         result.mesh['k'][nk*2+i,:]=(b1+b2)/2*(1-1.0*i/nk)
     return result
 
-def rectangle_bz(reciprocals=None,nk=100):
+def rectangle_bz(reciprocals=None,nk=100,nchunk=None):
     '''
     The whole rectangular BZ.
     '''
@@ -189,7 +297,7 @@ def rectangle_bz(reciprocals=None,nk=100):
         recips.append(array([0.0,2*pi]))
     else:
         recips=reciprocals
-    return KSpace(reciprocals=recips,nk=nk)
+    return KSpace(reciprocals=recips,nk=nk,nchunk=nchunk)
 
 square_gxm=rectangle_gxm
 square_gym=rectangle_gym
@@ -223,9 +331,11 @@ def hexagon_gkm(reciprocals=None,nk=100,vh='H'):
         result.mesh['k'][nk*2+i,:]=b1/2*(1-1.0*i/nk)
     return result
 
-def hexagon_bz(reciprocals=None,nk=100,vh='H'):
+def hexagon_bz(reciprocals=None,nk=99,vh='H',nchunk=None):
     '''
     The whole hexagonal BZ.
+    The number of mesh points nk along each unit translation vector must be a multiple of 3, see hexagon_mesh.
+    When nchunk is not None, the mesh is a LazyMesh generated nchunk points at a time.
     '''
     result=KSpace(nk=nk)
     if not reciprocals is None:
@@ -243,39 +353,108 @@ def hexagon_bz(reciprocals=None,nk=100,vh='H'):
         else:
           b1=array([1.0,0.0])*4*pi/sqrt(3.0)
           b2=array([0.5,sqrt(3.0)/2])*4*pi/sqrt(3.0)
-    ndim=b1.shape[0]
-    result.mesh['k']=zeros((nk**2,ndim))
+    function=lambda seqs: hexagon_mesh(b1,b2,nk,seqs)
+    result.mesh['k']=function(arange(nk**2)) if nchunk is None else LazyMesh(function,nk**2,b1.shape[0],nchunk)
+    result.volume['k']=abs(cross(b1,b2))
+    return result
+
+def hexagon_mesh(b1,b2,nk,seqs):
+    '''
+    This function returns some points of the mesh of the hexagonal BZ.
+    Parameters:
+        b1,b2: 1D ndarray
+            The unit translation vectors of the BZ with an angle of 60 degrees.
+        nk: integer
+            The number of mesh points along each unit translation vector, which must be a multiple of 3.
+        seqs: 1D ndarray of integers
+            The flat indices of the points.
+    Returns:
+        result: 2D ndarray
+            The coordinates of the points, row by row.
+    Note: the mesh is offset by (b1+b2)/3, i.e. a K point, so that it is invariant under the C6 rotations and the inversion, modulo the reciprocal lattice, only when nk is a multiple of 3.
+    Otherwise it could not be reduced by irreducible_bz, and the sums over it would not respect the symmetry of the BZ either.
+    '''
+    if nk%3!=0:
+        raise ValueError("Hexagon_mesh error: nk(%s) must be a multiple of 3."%nk)
     p0=-(b1+b2)/3
     p1=(b1+b2)/3
     p2=(b1+b2)*2/3
     p3=(b1*2-b2)/3
     p4=(b2*2-b1)/3
-    for i in xrange(nk):
-        for j in xrange(nk):
-          coords=b1*(i-1)/nk+b2*(j-1)/nk+p0
-          if in_triangle(coords,p1,p2,p3): coords=coords-b1
-          if in_triangle(coords,p1,p2,p4): coords=coords-b2
-          result.mesh['k'][i*nk+j,:]=coords
-    result.volume['k']=abs(cross(b1,b2))
+    seqs=asarray(seqs)
+    result=outer((seqs//nk-1)*1.0/nk,b1)+outer((seqs%nk-1)*1.0/nk,b2)+p0
+    result[in_triangle(result,p1,p2,p3)]-=b1
+    result[in_triangle(result,p1,p2,p4)]-=b2
     return result
-    
+
 def in_triangle(p0,p1,p2,p3):
     '''
-    Judge whether a point represented by p0 belongs to the interior of a triangle whose vertices are p1,p2 and p3.
+    Judge whether points belong to the interior of a triangle whose vertices are p1,p2 and p3.
+    Parameters:
+        p0: 1D ndarray or 2D ndarray
+            The coordinates of a point, or those of several points row by row.
+        p1,p2,p3: 1D ndarray
+            The vertices of the triangle.
+    Returns:
+        result: logical or 1D ndarray of logical
+            The judgement for each point.
     '''
+    p0=asarray(p0)
     a=zeros((3,3))
-    b=zeros(3)
-    x=zeros(3)
-    ndim=p0.shape[0]
+    b=zeros(p0.shape[:-1]+(3,))
+    ndim=p0.shape[-1]
     a[0:ndim,0]=p2-p1
     a[0:ndim,1]=p3-p1
     a[(2 if ndim==2 else 0):3,2]=cross(p2-p1,p3-p2)
-    b[0:ndim]=p0-p1
-    x=dot(inv(a),b)
-    if x[0]>=0 and x[0]<=1 and x[1]>=0 and x[1]<=1 and x[0]+x[1]<=1:
-        return True
-    else:
-        return False
+    b[...,0:ndim]=p0-p1
+    x=dot(b,inv(a).T)
+    return (x[...,0]>=0)&(x[...,0]<=1)&(x[...,1]>=0)&(x[...,1]<=1)&(x[...,0]+x[...,1]<=1)
+
+def irreducible_bz(kspace,reciprocals,ops):
+    '''
+    This function reduces a mesh of the BZ to its irreducible wedge under a point group.
+    Parameters:
+        kspace: BaseSpace
+            The K-space whose mesh, modulo the reciprocal lattice, is invariant under the point group, e.g. the one returned by KSpace or hexagon_bz.
+        reciprocals: list of 1D ndarray
+            The unit translation vectors of the BZ.
+        ops: list of 2D ndarray
+            The orthogonal matrices of the point group, e.g. the ones returned by Lattice.point_group.
+            The group generated by them is used.
+    Returns:
+        result: BaseSpace
+            The K-space containing one representative of each orbit of the mesh points, weighted by the number of the points in that orbit.
+    Note: the mesh must be invariant under the point group modulo the reciprocal lattice, or a ValueError is raised.
+    KSpace meshes are invariant under the point groups of their lattices, while hexagon_bz meshes are invariant under C6 only when nk is a multiple of 3, which hexagon_mesh enforces.
+    The weighted sum over the result equals the sum over the whole mesh only for quantities invariant under the point group,
+    such as the density of states, the electron number and the grand potential, but not the Berry curvature or the k-resolved spectra.
+    '''
+    mesh=asarray(kspace.mesh['k'])
+    ops=point_group_closure(ops)
+    buff=array(reciprocals)
+    keys=lambda coords: [tuple(key) for key in around(mod(dot(coords,pinv(buff))+RZERO,1.0)-RZERO,decimals=8)]
+    indices={key:i for i,key in enumerate(keys(mesh))}
+    images=zeros((len(ops),mesh.shape[0]),dtype=int64)
+    for n,op in enumerate(ops):
+        for i,key in enumerate(keys(dot(mesh,op.T))):
+            if key not in indices:
+                raise ValueError("Irreducible_bz error: the mesh is not invariant under the point group.")
+            images[n,i]=indices[key]
+    reps=images.min(axis=0)
+    seqs=nonzero(reps==arange(mesh.shape[0]))[0]
+    return BaseSpace({'tag':'k','mesh':mesh[seqs],'volume':kspace.volume['k'],'weight':bincount(reps)[seqs]})
+
+def point_group_closure(ops):
+    '''
+    This function returns the group generated by a list of orthogonal matrices with the identity being the first element.
+    '''
+    result=[identity(ops[0].shape[0])]
+    for op in result:
+        for g in ops:
+            buff=dot(g,op)
+            if all([norm(buff-other)>RZERO for other in result]):
+                result.append(buff)
+    return result
 
 def TSpace(mesh):
     '''
@@ -2,8 +2,6 @@
 Basis of electrons systems in the occupation number representation.
 '''
 from numpy import *
-from math import factorial
-from itertools import combinations
 from numba import jit
 
 class BasisE:
@@ -27,9 +25,20 @@ class BasisE:
             The table of allowed binary basis of the Hilbert space.
         nbasis: integer 
             The dimension of the Hilbert space.
+        rank_table: 2D ndarray of integers
+            The table of binomial coefficients, rank_table[n,k]==C(n,k), used to rank a binary basis by the combinatorial number system.
+            It is empty when the ranking is switched off or when basis_type=='EG', in which case the binary search in basis_table is used instead.
+        rank_info: 1D ndarray of integers
+            The information to combine the ranks of the spin-up and spin-down parts of a binary basis:
+                rank_info[0]: the number of the lower bits, i.e. the spin-down orbitals for 'ES' and all the orbitals for 'EP';
+                rank_info[1]: the number of allowed configurations of the lower bits.
+            For 'EG', it is [nstate,nbasis,parity] with parity=-1 when the parity is not fixed.
+        parity: integer or None
+            For 'EG', the parity of the total number of electrons, 0 for even and 1 for odd, or None when the parity is not fixed.
+            In a fixed-parity basis, a binary basis is determined by its higher nstate-1 bits, so that its sequence is simply basis_rep>>1.
     '''
     
-    def __init__(self,tuple=(),up=(),down=(),nstate=0,dtype=int64):
+    def __init__(self,tuple=(),up=(),down=(),nstate=0,parity=None,dtype=int64,ranking=True):
         '''
         Constructor.
         It can be used in three different ways:
@@ -52,8 +61,12 @@ class BasisE:
                         The number of spin-up/spin-down electrons.
             nstate: integer,optional
                 The number of states which is used to generate a particle-non-conserved basis.
+            parity: 0, 1 or None, optional
+                The parity of the number of electrons of a particle-non-conserved basis, which is not fixed when it is None.
             dtype: dtype
                 The data type of the attribute basis_table.
+            ranking: logical, optional
+                A flag to tag whether the combinatorial number system is used to get the sequence of a binary basis.
         Note: 
             If more than needed parameters to generate a certain kind a basis are assigned, this method obeys the following priority to create the instance: "EP" > "ES" > "EG".
         '''
@@ -63,18 +76,27 @@ class BasisE:
             self.nparticle=array(tuple[1])
             self.basis_table=basis_table_ep(tuple[0],tuple[1],dtype=dtype)
             self.nbasis=len(self.basis_table)
+            self.rank_table=binomial_table(tuple[0]) if ranking else zeros((0,0),dtype=int64)
+            self.rank_info=array([tuple[0],self.nbasis],dtype=int64)
+            self.parity=None
         elif len(up)==2 and len(down)==2:
             self.basis_type="ES"
             self.nstate=array([up[0],down[0]])
             self.nparticle=array([up[1],down[1]])
             self.basis_table=basis_table_es(up,down,dtype=dtype)
             self.nbasis=len(self.basis_table)
+            self.rank_table=binomial_table(max(up[0],down[0])) if ranking else zeros((0,0),dtype=int64)
+            self.rank_info=array([down[0],binomial(down[0],down[1])],dtype=int64)
+            self.parity=None
         else:
             self.basis_type="EG"
             self.nstate=array(nstate)
             self.nparticle=array([])
-            self.basis_table=array([])
-            self.nbasis=2**nstate
+            self.basis_table=array([],dtype=dtype)
+            self.nbasis=2**nstate if parity is None else 2**(nstate-1)
+            self.rank_table=zeros((0,0),dtype=int64)
+            self.rank_info=array([nstate,self.nbasis,-1 if parity is None else parity],dtype=int64)
+            self.parity=parity
 
     def __str__(self):
         '''
@@ -83,58 +105,86 @@ class BasisE:
         result=''
         if self.basis_type=='EG':
             for i in xrange(self.nbasis):
-                result+=str(i)+': '+'{0:b}'.format(i)+'\n'
+                result+=str(i)+': '+'{0:b}'.format(basis_rep(i,self.basis_table,self.rank_info))+'\n'
         else:
             for i,v in enumerate(self.basis_table):
                 result+=str(i)+': '+'{0:b}'.format(v)+'\n'
         return result
 
+def binomial(n,k):
+    '''
+    This function returns the exact binomial coefficient C(n,k).
+    '''
+    if k<0 or k>n: return 0
+    result=1
+    for i in xrange(min(k,n-k)):
+        result=result*(n-i)/(i+1)
+    return result
+
+def binomial_table(nmax):
+    '''
+    This function returns the table of binomial coefficients whose element [n,k] is C(n,k) for 0<=n,k<=nmax.
+    '''
+    result=zeros((nmax+1,nmax+1),dtype=int64)
+    for n in xrange(nmax+1):
+        result[n,0]=1
+        for k in xrange(1,n+1):
+            result[n,k]=result[n-1,k-1]+result[n-1,k]
+    return result
+
 def basis_table_ep(nstate,nparticle,dtype=int64):
     '''
     This function generates the binary basis table with nstate orbitals occupied by nparticle electrons.
+    The table is emitted already sorted by Gosper's hack, i.e. the next-combination bit trick.
     '''
-    result=zeros(factorial(nstate)/factorial(nparticle)/factorial(nstate-nparticle),dtype=dtype)
-    buff=combinations(xrange(nstate),nparticle)
-    for i,v in enumerate(buff):
-        basis=0
-        for num in v:
-            basis+=(1<<num)
-        result[i]=basis
-    result.sort()
+    result=zeros(binomial(nstate,nparticle),dtype=dtype)
+    if len(result)>0: gosper(result,nparticle)
     return result
 
+@jit
+def gosper(result,nparticle):
+    '''
+    This function fills result with the binary basis with nparticle occupied orbitals in the ascending order.
+    '''
+    nbasis=len(result)
+    basis=(1<<nparticle)-1
+    for i in xrange(nbasis):
+        result[i]=basis
+        if i<nbasis-1:
+            lowest=basis&-basis
+            ripple=basis+lowest
+            basis=(((ripple^basis)>>2)//lowest)|ripple
+
 def basis_table_es(up,down,dtype=int64):
     '''
     This function generates the binary basis table according to the up and down tuples.
+    The table is the outer combination of the spin-up and spin-down tables, which is sorted by construction.
     '''
-    result=zeros(factorial(up[0])/factorial(up[1])/factorial(up[0]-up[1])*factorial(down[0])/factorial(down[1])/factorial(down[0]-down[1]),dtype=dtype)
-    buff_up=list(combinations(xrange(up[0]),up[1]))
-    buff_dn=list(combinations(xrange(down[0]),down[1]))
-    count=0
-    for vup in buff_up:
-        buff=0
-        for num in vup:
-            buff+=(1<<num)
-        buff=buff<<down[0]
-        for vdn in buff_dn:
-            basis=buff
-            for num in vdn:
-                basis+=(1<<num)
-            result[count]=basis
-            count+=1
-    result.sort()
-    return result
+    buff_up=basis_table_ep(up[0],up[1],dtype=dtype)
+    buff_dn=basis_table_ep(down[0],down[1],dtype=dtype)
+    return ((buff_up[:,newaxis]<<down[0])|buff_dn[newaxis,:]).ravel()
 
 @jit
-def basis_rep(seq_basis,basis_table):
+def basis_rep(seq_basis,basis_table,rank_info):
     '''
     This function returns the binary basis representation whose sequence in basis_table is seq_basis.
+    For 'EG' bases, basis_table is empty and the representation is computed directly, with the lowest bit fixed by the parity when rank_info[2]>=0.
     '''
     if len(basis_table)==0:
+        if rank_info[2]>=0:
+            return (seq_basis<<1)|((popcount(seq_basis)&1)^rank_info[2])
         return seq_basis
     else:
         return basis_table[seq_basis]
 
+@jit
+def basis_table_eg(result,rank_info):
+    '''
+    This function fills result with all the binary basis of an 'EG' basis in the ascending order.
+    '''
+    for i in xrange(len(result)):
+        result[i]=basis_rep(i,result[0:0],rank_info)
+
 @jit
 def seq_basis(basis_rep,basis_table):
     '''
@@ -157,3 +207,243 @@ def seq_basis(basis_rep,basis_table):
         else:
             return result
         raise ValueError('Seq_basis error: the input basis_rep is not in the basis_table.')
+
+@jit
+def popcount(basis_rep):
+    '''
+    This function returns the number of occupied orbitals of a binary basis, i.e. the number of set bits of a non-negative 64-bit integer.
+    The bits are summed in parallel within the integer itself (SWAR), so the cost does not depend on the position of the highest set bit.
+    '''
+    result=basis_rep-((basis_rep>>1)&0x5555555555555555)
+    result=(result&0x3333333333333333)+((result>>2)&0x3333333333333333)
+    result=(result+(result>>4))&0x0f0f0f0f0f0f0f0f
+    result+=result>>8
+    result+=result>>16
+    result+=result>>32
+    return result&0x7f
+
+@jit
+def rank_basis(basis_rep,rank_table):
+    '''
+    This function returns the rank of basis_rep among all the binary basis with the same number of occupied orbitals.
+    The combinatorial number system is used, i.e. the rank of a basis with occupied orbitals c1<c2<...<ck is C(c1,1)+C(c2,2)+...+C(ck,k), which coincides with its sequence in the sorted basis table.
+    '''
+    result=0
+    count=0
+    pos=0
+    while basis_rep:
+        if basis_rep&1:
+            count+=1
+            result+=rank_table[pos,count]
+        basis_rep>>=1
+        pos+=1
+    return result
+
+@jit
+def seq_basis_rank(basis_rep,basis_table,rank_table,rank_info):
+    '''
+    This function returns the basis sequence of basis_rep.
+    When rank_table is not empty, the sequence is obtained by the combinatorial number system without any memory access into basis_table.
+    For 'EG' bases, the sequence is the binary basis itself, or basis_rep>>1 when the parity is fixed.
+    Otherwise, it falls back to the binary search in basis_table.
+    '''
+    if len(basis_table)==0:
+        return basis_rep>>1 if rank_info[2]>=0 else basis_rep
+    elif len(rank_table)==0:
+        return seq_basis(basis_rep,basis_table)
+    else:
+        low=basis_rep&((1<<rank_info[0])-1)
+        return rank_basis(basis_rep>>rank_info[0],rank_table)*rank_info[1]+rank_basis(low,rank_table)
+
+class SymmetricBasisE:
+    '''
+    Symmetry-adapted basis of electron systems in the occupation number representation.
+    For an abelian group G of orbital permutations, each of which may be followed by a particle-hole transformation c_i->eta_i*c_i^dagger, and one of its one-dimensional irreducible representations chi, each basis state is
+        |r>~=N_r^(-1/2)*sum_g conj(chi(g))*g|r>,
+    where r, the representative, is the smallest binary basis of its orbit in the parent basis and N_r=|G|*sum_{g in Stab(r)} conj(chi(g))*sign_g(r) is the orbit normalization.
+    Representatives with a vanishing N_r are not compatible with chi and are excluded.
+    Attributes:
+        basis: BasisE
+            The parent basis.
+        basis_type,nstate,nparticle: 
+            The same as those of the parent basis.
+        perms: 2D ndarray of integers
+            The group elements, with perms[g,i] the orbital to which the orbital i is mapped by the g-th element.
+        holes: 2D ndarray of integers
+            The particle-hole parts of the group elements, with holes[g,:] the signs eta of the g-th element or zeros when it involves no particle-hole transformation.
+        chars: 1D ndarray
+            The characters of the irreducible representation, with chars[g] for the g-th group element.
+        basis_table: 1D ndarray of integers
+            The sorted representatives.
+        norms: 1D ndarray of floats
+            The orbit normalizations N_r of the representatives.
+        nbasis: integer
+            The dimension of the symmetry sector.
+        rank_table,rank_info:
+            Empty placeholders, since representatives are always located by the binary search in basis_table.
+    '''
+
+    def __init__(self,basis,perms,chars,holes=None):
+        '''
+        Constructor.
+        Parameters:
+            basis: BasisE
+                The parent basis.
+            perms: 2D array-like of integers
+                The group elements as orbital permutations.
+            chars: 1D array-like
+                The characters of the irreducible representation.
+            holes: 2D array-like of integers, optional
+                The particle-hole parts of the group elements. When it is None, no element involves the particle-hole transformation.
+        '''
+        self.basis=basis
+        self.basis_type=basis.basis_type
+        self.nstate=basis.nstate
+        self.nparticle=basis.nparticle
+        self.perms=asarray(perms,dtype=int64)
+        self.holes=zeros(self.perms.shape,dtype=int64) if holes is None else asarray(holes,dtype=int64)
+        self.chars=asarray(chars)
+        self.chars=self.chars.real.astype(float64) if all(abs(self.chars.imag)<10**-10) else self.chars.astype(complex128)
+        if len(basis.basis_table)>0:
+            table=basis.basis_table
+        else:
+            table=zeros(basis.nbasis,dtype=int64)
+            basis_table_eg(table,basis.rank_info)
+        norms=zeros(len(table))
+        sym_norms(norms,table,self.perms,self.holes,self.chars.astype(complex128))
+        mask=norms>10**-10
+        self.basis_table=table[mask]
+        self.norms=norms[mask]
+        self.nbasis=len(self.basis_table)
+        self.rank_table=zeros((0,0),dtype=int64)
+        self.rank_info=zeros(2,dtype=int64)
+
+    def __str__(self):
+        '''
+        Convert an instance to string.
+        '''
+        result=''
+        for i,(v,n) in enumerate(zip(self.basis_table,self.norms)):
+            result+=str(i)+': '+'{0:b}'.format(v)+', '+str(n)+'\n'
+        return result
+
+    def expand(self,vector):
+        '''
+        This method expands a vector in the symmetry sector onto the parent basis.
+        Parameters:
+            vector: 1D ndarray
+                The vector in the symmetry sector.
+        Returns:
+            result: 1D ndarray
+                The vector in the parent basis.
+        '''
+        vector=asarray(vector)
+        result=zeros(self.basis.nbasis,dtype=complex128)
+        sym_expand(result,vector.astype(complex128),self.basis_table,self.norms,self.perms,self.holes,self.chars.astype(complex128),self.basis.basis_table,self.basis.rank_table,self.basis.rank_info)
+        return result.real.copy() if self.chars.dtype==float64 and vector.dtype==float64 else result
+
+@jit
+def sym_act(basis_rep,perm,hole):
+    '''
+    This function applies an orbital permutation, followed by a particle-hole transformation when hole[0]!=0, onto a binary basis.
+    The particle-hole transformation maps the vacuum to the fully occupied state and c_i^dagger to hole[i]*c_i.
+    Returns:
+        rep: integer
+            The transformed binary basis.
+        sign: integer
+            The fermionic sign from reordering the permuted creation operators and from the particle-hole transformation.
+    '''
+    result=0
+    ninv=0
+    pos=0
+    nsum=0
+    eta=1
+    while basis_rep:
+        if basis_rep&1:
+            target=perm[pos]
+            ninv+=popcount(result>>(target+1))
+            result|=1<<target
+            nsum+=target
+            if hole[0]!=0: eta*=hole[target]
+        basis_rep>>=1
+        pos+=1
+    if hole[0]!=0:
+        ninv+=nsum
+        result^=(1<<len(perm))-1
+        return result,(1-2*(ninv&1))*eta
+    return result,1-2*(ninv&1)
+
+@jit
+def sym_rep(basis_rep,perms,holes,chars):
+    '''
+    This function returns the representative of the orbit of a binary basis, together with the factor sign_g*conj(chi(g)) of the group element g which maps the basis onto it.
+    '''
+    result=basis_rep
+    factor=chars[0].conjugate()
+    for g in xrange(perms.shape[0]):
+        rep,sign=sym_act(basis_rep,perms[g],holes[g])
+        if g==0 or rep<result:
+            result=rep
+            factor=chars[g].conjugate()*sign
+    return result,factor
+
+@jit
+def sym_norms(norms,table,perms,holes,chars):
+    '''
+    This function fills the orbit normalizations of the binary basis in table, which are zero for non-representatives.
+    '''
+    ngroup=perms.shape[0]
+    for i in xrange(len(table)):
+        basis_rep=table[i]
+        buff=0j
+        for g in xrange(ngroup):
+            rep,sign=sym_act(basis_rep,perms[g],holes[g])
+            if rep<basis_rep: 
+                buff=0j
+                break
+            if rep==basis_rep: buff+=chars[g].conjugate()*sign
+        norms[i]=buff.real*ngroup
+
+@jit
+def sym_expand(result,vector,table,norms,perms,holes,chars,basis_table,rank_table,rank_info):
+    '''
+    This function expands a vector in a symmetry sector onto the parent basis.
+    '''
+    for i in xrange(len(table)):
+        coeff=vector[i]/sqrt(norms[i])
+        for g in xrange(perms.shape[0]):
+            rep,sign=sym_act(table[i],perms[g],holes[g])
+            result[seq_basis_rank(rep,basis_table,rank_table,rank_info)]+=coeff*chars[g].conjugate()*sign
+
+def permutation_parity(perm):
+    '''
+    This function returns the parity of a permutation, 0 for even and 1 for odd.
+    '''
+    visited=zeros(len(perm),dtype=bool)
+    result=0
+    for i in xrange(len(perm)):
+        if not visited[i]:
+            j=i
+            while not visited[j]:
+                visited[j]=True
+                j=perm[j]
+                result+=1
+            result-=1
+    return result%2
+
+@jit
+def seq_basis_find(basis_rep,basis_table):
+    '''
+    This function returns the sequence of basis_rep in the sorted basis_table, or -1 when it is absent.
+    '''
+    lb=0;ub=len(basis_table)
+    while lb<ub:
+        mid=(lb+ub)/2
+        if basis_table[mid]<basis_rep:
+            lb=mid+1
+        else:
+            ub=mid
+    if lb<len(basis_table) and basis_table[lb]==basis_rep:
+        return lb
+    else:
+        return -1
@@ -106,6 +106,45 @@ class Generator:
                 result.extend(opts)
         return result
 
+    def packed(self):
+        '''
+        This method returns the operators generated by self packed into arrays, which is convenient for vectorized constructions of quadratic Hamiltonians.
+        Returns:
+            seqs: 2D ndarray of int64
+                seqs[i,:] are the seqs of the i-th operator.
+            values: 1D ndarray of complex128
+                values[i] is the coefficient of the i-th operator.
+            rcoords: 2D ndarray of float64
+                rcoords[i,:] is the first rcoord of the i-th operator.
+        Note: the arrays are cached and rebuilt only after the alterable operators are updated.
+        '''
+        if 'packed' not in self.cache:
+            operators=self.operators
+            seqs=array([opt.seqs for opt in operators],dtype=int64).reshape((len(operators),-1))
+            values=array([opt.value for opt in operators],dtype=complex128)
+            rcoords=array([opt.rcoords[0] for opt in operators],dtype=float64).reshape((len(operators),-1))
+            self.cache['packed']=(seqs,values,rcoords)
+        return self.cache['packed']
+
+    def unit_operators(self,key):
+        '''
+        This method returns the operators of an alterable term whose coefficient is set to be 1.
+        Parameters:
+            key: string
+                The tag of the alterable term.
+        Returns:
+            result: OperatorList or None
+                The operators with unit coefficient, so that the actual operators are result*self.parameters['alter'][key].
+                None is returned when the coefficient of the term is not a scalar.
+        '''
+        if ndim(self.terms['alter'][key][0].value)>0: return None
+        terms=deepcopy(self.terms['alter'][key])
+        terms[0].value=1
+        result=OperatorList()
+        for bond in self.bonds:
+            result.extend(terms.operators(bond,self.table,half=self.half))
+        return result
+
     def update(self,**karg):
         '''
         This method updates the alterable operators by keyword arguments.
@@ -118,6 +157,7 @@ class Generator:
                     term[0].value=nv
                     self.parameters['alter'][key]=nv
                     masks[key]=True
+            if any(masks.values()): self.cache.pop('packed',None)
             for key,mask in masks.iteritems():
                 if mask:
                     self.cache['alter'][key]=OperatorList()
@@ -3,7 +3,7 @@ Lattice.
 '''
 from BasicGeometryPy import *
 from BondPy import *
-from numpy.linalg import inv
+from numpy.linalg import inv,lstsq
 import itertools
 import matplotlib.pyplot as plt
 
@@ -120,6 +120,63 @@ class Lattice(object):
         '''
         return union([p.table(nambu=nambu) for p in self.points.itervalues()],key=lambda value: value.to_tuple(indication=self.priority))
 
+    def translations(self):
+        '''
+        Return the translations which map the lattice onto itself modulo the translation vectors, i.e. the translation group of a periodic cluster.
+        Returns:
+            result: list of 2-tuple
+                For each tuple:
+                    tuple[0]: 1D ndarray
+                        The translation.
+                    tuple[1]: dict
+                        The map from the key of each point to the key of its image.
+                The identity is always the first one.
+        '''
+        keys=sorted(self.points.keys())
+        origin=self.points[keys[0]]
+        result=[]
+        for key in keys:
+            if self.points[key].struct.atom!=origin.struct.atom: continue
+            translation=self.points[key].rcoord-origin.rcoord
+            buff={}
+            for p in keys:
+                for q in keys:
+                    if self.points[p].struct.atom==self.points[q].struct.atom and is_lattice_vector(self.points[p].rcoord+translation-self.points[q].rcoord,self.vectors):
+                        buff[p]=q
+                        break
+            if len(buff)==len(keys) and len(set(buff.itervalues()))==len(keys):
+                result.append((translation,buff))
+        return result
+
+    def point_group(self):
+        '''
+        Return the point group of the lattice, i.e. the orthogonal transformations which, followed by a proper translation, map the lattice onto itself.
+        Only lattices whose translation vectors span the whole space are supported.
+        Returns:
+            result: list of 2D ndarray
+                The orthogonal matrices of the point group, with the identity being the first one.
+        '''
+        ndim=self.vectors[0].shape[0]
+        if len(self.vectors)!=ndim:
+            raise ValueError("Lattice point_group error: the translation vectors should span the whole space.")
+        buff=array(self.vectors).T
+        candidates=[dot(buff,n) for n in itertools.product(xrange(-2,3),repeat=ndim) if any(n)]
+        images=[[c for c in candidates if abs(norm(c)-norm(v))<RZERO] for v in self.vectors]
+        keys=sorted(self.points.keys())
+        origin=self.points[keys[0]]
+        result=[]
+        for vs in itertools.product(*images):
+            op=dot(array(vs).T,inv(buff))
+            if norm(dot(op.T,op)-identity(ndim))>RZERO or any([norm(op-g)<RZERO for g in result]): continue
+            for key in keys:
+                if self.points[key].struct.atom!=origin.struct.atom: continue
+                translation=self.points[key].rcoord-dot(op,origin.rcoord)
+                if all([any([self.points[p].struct.atom==self.points[q].struct.atom and is_lattice_vector(dot(op,self.points[p].rcoord)+translation-self.points[q].rcoord,self.vectors) for q in keys]) for p in keys]):
+                    result.append(op)
+                    break
+        result.sort(key=lambda op: norm(op-identity(ndim)))
+        return result
+
 def bonds(points,vectors=None,nneighbour=1):
     '''
     This function returns all the bonds up to the nneighbour-th order.
@@ -190,6 +247,15 @@ def bonds(points,vectors=None,nneighbour=1):
             bond.neighbour=nb
     return result
 
+def is_lattice_vector(coords,vectors):
+    '''
+    This function judges whether the input coords is an integer combination of the input vectors.
+    '''
+    if len(vectors)==0: return norm(coords)<RZERO
+    buff=array(vectors).T
+    x=around(lstsq(buff,coords)[0])
+    return norm(coords-dot(buff,x))<RZERO
+
 def reciprocals(vectors):
     '''
     This function returns the corresponding reciprocals dual to the input vectors.
@@ -2,6 +2,7 @@
 Name of Engine.
 '''
 from collections import OrderedDict
+from hashlib import md5
 class Name:
     '''
     This class provides an engine with a name.
@@ -65,3 +66,15 @@ class Name:
             result+=repr(obj)+'_'
         result+=self.suffix
         return result
+
+    @property
+    def digest(self):
+        '''
+        This method returns the md5 hex digest of both the constant and the alterable parameters with their keys, which can be used to check whether two engines share exactly the same parameters.
+        '''
+        result=md5()
+        for key,obj in self._const.iteritems():
+            result.update(repr(key)+':'+repr(obj)+';')
+        for key,obj in self._alter.iteritems():
+            result.update(repr(key)+':'+repr(obj)+';')
+        return result.hexdigest()
@@ -4,7 +4,8 @@ Operator representation.
 from OperatorPy import *
 from BasisEPy import *
 from scipy.sparse import *
-from numba import jit
+from scipy.sparse.linalg import LinearOperator
+from numba import jit,prange
 def opt_rep(operator,basis,transpose=False,dtype=complex128):
     '''
     This function returns the csr_formed or csc_formed sparse matrix representation of an operator on the occupation number basis.
@@ -39,179 +40,172 @@ def opt_rep(operator,basis,transpose=False,dtype=complex128):
     else:
         raise ValueError("Opt_rep error: only operators with rank=1,2,4 are supported.")
 
+def index_dtype(n):
+    '''
+    This function returns the integer type, int32 or int64, needed to index n elements of a sparse matrix.
+    '''
+    return int32 if n<=iinfo(int32).max else int64
+
 def opt_rep_1(operator,basis1,basis2,transpose,dtype=complex128):
     nbasis1=basis1.nbasis
     nbasis2=basis2.nbasis
     data=zeros(nbasis1,dtype=dtype)
-    indices=zeros(nbasis1,dtype=int32)
-    indptr=zeros(nbasis1+1,dtype=int32)
+    indices=zeros(nbasis1,dtype=index_dtype(max(nbasis1,nbasis2)))
+    indptr=zeros(nbasis1+1,dtype=index_dtype(max(nbasis1,nbasis2)))
     seq=operator.seqs[0]
     basis_table1=basis1.basis_table
+    rank_info1=basis1.rank_info
     basis_table2=basis2.basis_table
+    rank_table2=basis2.rank_table
+    rank_info2=basis2.rank_info
     if operator.indices[0].nambu==CREATION:
-        opt_rep_1_1(data,indices,indptr,nbasis1,nbasis2,basis_table1,basis_table2,seq)
+        opt_rep_1_1(data,indices,indptr,nbasis1,nbasis2,basis_table1,rank_info1,basis_table2,rank_table2,rank_info2,seq)
     else:
-        opt_rep_1_0(data,indices,indptr,nbasis1,nbasis2,basis_table1,basis_table2,seq)
+        opt_rep_1_0(data,indices,indptr,nbasis1,nbasis2,basis_table1,rank_info1,basis_table2,rank_table2,rank_info2,seq)
     if transpose==False:
         return csr_matrix((data*operator.value,indices,indptr),shape=(nbasis1,nbasis2))
     else:
         return csr_matrix((data*operator.value,indices,indptr),shape=(nbasis1,nbasis2)).T
 
 @jit
-def opt_rep_1_1(data,indices,indptr,nbasis1,nbasis2,basis_table1,basis_table2,seq):
+def opt_rep_1_1(data,indices,indptr,nbasis1,nbasis2,basis_table1,rank_info1,basis_table2,rank_table2,rank_info2,seq):
     ndata=0
     for i in xrange(nbasis1):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table1)
+        rep=basis_rep(i,basis_table1,rank_info1)
         if not rep&1<<seq:
-            nsign=0
-            for j in xrange(seq):
-                if rep&1<<j: nsign+=1
+            nsign=popcount(rep&((1<<seq)-1))
             rep=rep|1<<seq
-            indices[ndata]=seq_basis(rep,basis_table2)
-            data[ndata]=(-1)**nsign
+            indices[ndata]=seq_basis_rank(rep,basis_table2,rank_table2,rank_info2)
+            data[ndata]=1-2*(nsign&1)
             ndata+=1
     indptr[nbasis1]=ndata
 
 @jit
-def opt_rep_1_0(data,indices,indptr,nbasis1,nbasis2,basis_table1,basis_table2,seq):
+def opt_rep_1_0(data,indices,indptr,nbasis1,nbasis2,basis_table1,rank_info1,basis_table2,rank_table2,rank_info2,seq):
     ndata=0
     for i in xrange(nbasis1):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table1)
+        rep=basis_rep(i,basis_table1,rank_info1)
         if rep&1<<seq:
-            nsign=0
-            for j in xrange(seq):
-                if rep&1<<j: nsign+=1
+            nsign=popcount(rep&((1<<seq)-1))
             rep=rep&~(1<<seq)
-            indices[ndata]=seq_basis(rep,basis_table2)
-            data[ndata]=(-1)**nsign
+            indices[ndata]=seq_basis_rank(rep,basis_table2,rank_table2,rank_info2)
+            data[ndata]=1-2*(nsign&1)
             ndata+=1
     indptr[nbasis1]=ndata
 
 def opt_rep_2(operator,basis,transpose,dtype=complex128):
     nbasis=basis.nbasis
     data=zeros(nbasis,dtype=dtype)
-    indices=zeros(nbasis,dtype=int32)
-    indptr=zeros(nbasis+1,dtype=int32)
+    indices=zeros(nbasis,dtype=index_dtype(nbasis))
+    indptr=zeros(nbasis+1,dtype=index_dtype(nbasis))
     seq1=operator.seqs[0]
     seq2=operator.seqs[1]
     basis_table=basis.basis_table
+    rank_table=basis.rank_table
+    rank_info=basis.rank_info
     if operator.indices[0].nambu==CREATION and operator.indices[1].nambu==ANNIHILATION:
-        opt_rep_2_10(data,indices,indptr,nbasis,basis_table,seq1,seq2)
+        opt_rep_2_10(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2)
     elif operator.indices[0].nambu==ANNIHILATION and operator.indices[1].nambu==CREATION:
-        opt_rep_2_01(data,indices,indptr,nbasis,basis_table,seq1,seq2)
-    elif opetator.indices[0].nambu==ANNIHILATION and operator.indices[1].nambu==ANNIHILATION:
-        opt_rep_2_00(data,indices,indptr,nbasis,basis_table,seq1,seq2)
+        opt_rep_2_01(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2)
+    elif operator.indices[0].nambu==ANNIHILATION and operator.indices[1].nambu==ANNIHILATION:
+        opt_rep_2_00(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2)
     else:
-        opt_rep_2_11(data,indices,indptr,nbasis,basis_table,seq1,seq2)
+        opt_rep_2_11(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2)
     if transpose==False:
         return csr_matrix((data*operator.value,indices,indptr),shape=(nbasis,nbasis))
     else:
         return csr_matrix((data*operator.value,indices,indptr),shape=(nbasis,nbasis)).T
 
 @jit
-def opt_rep_2_10(data,indices,indptr,nbasis,basis_table,seq1,seq2):
+def opt_rep_2_10(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2):
     ndata=0
     for i in xrange(nbasis):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table)
+        rep=basis_rep(i,basis_table,rank_info)
         if rep&1<<seq2:
             rep1=rep&~(1<<seq2)
             if not rep1&(1<<seq1):
-                nsign=0
-                for j in xrange(seq2):
-                    if rep&1<<j: nsign+=1
-                for j in xrange(seq1):
-                    if rep1&1<<j: nsign+=1
+                nsign=popcount(rep&((1<<seq2)-1))+popcount(rep1&((1<<seq1)-1))
                 rep2=rep1|1<<seq1
-                indices[ndata]=seq_basis(rep2,basis_table)
-                data[ndata]=(-1)**nsign
+                indices[ndata]=seq_basis_rank(rep2,basis_table,rank_table,rank_info)
+                data[ndata]=1-2*(nsign&1)
                 ndata+=1
     indptr[nbasis]=ndata
 
 @jit
-def opt_rep_2_01(data,indices,indptr,nbasis,basis_table,seq1,seq2):
+def opt_rep_2_01(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2):
     ndata=0
     for i in xrange(nbasis):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table)
+        rep=basis_rep(i,basis_table,rank_info)
         if not rep&1<<seq2:
             rep1=rep|1<<seq2
             if rep1&1<<seq1:
-                nsign=0
-                for j in xrange(seq2):
-                    if rep&1<<j: nsign+=1
-                for j in xrange(seq1):
-                    if rep1&1<<j: nsign+=1
+                nsign=popcount(rep&((1<<seq2)-1))+popcount(rep1&((1<<seq1)-1))
                 rep2=rep1&~(1<<seq1)
-                indices[ndata]=seq_basis(rep2,basis_table)
-                data[ndata]=(-1)**nsign
+                indices[ndata]=seq_basis_rank(rep2,basis_table,rank_table,rank_info)
+                data[ndata]=1-2*(nsign&1)
                 ndata+=1
     indptr[nbasis]=ndata
 
 @jit
-def opt_rep_2_00(data,indices,indptr,nbasis,basis_table,seq1,seq2):
+def opt_rep_2_00(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2):
     ndata=0
     for i in xrange(nbasis):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table)
+        rep=basis_rep(i,basis_table,rank_info)
         if rep&1<<seq2:
             rep1=rep&~(1<<seq2)
             if rep1&1<<seq1:
-                nsign=0
-                for j in xrange(seq2):
-                    if rep&1<<j: nsign+=1
-                for j in xrange(seq1):
-                    if rep1&1<<j: nsign+=1
+                nsign=popcount(rep&((1<<seq2)-1))+popcount(rep1&((1<<seq1)-1))
                 rep2=rep1&~(1<<seq1)
-                indices[ndata]=seq_basis(rep2,basis_table)
-                data[ndata]=(-1)**nsign
+                indices[ndata]=seq_basis_rank(rep2,basis_table,rank_table,rank_info)
+                data[ndata]=1-2*(nsign&1)
                 ndata+=1
     indptr[nbasis]=ndata
 
 @jit
-def opt_rep_2_11(data,indices,indptr,nbasis,basis_table,seq1,seq2):
+def opt_rep_2_11(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2):
     ndata=0
     for i in xrange(nbasis):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table)
+        rep=basis_rep(i,basis_table,rank_info)
         if not rep&1<<seq2:
             rep1=rep|1<<seq2
             if not rep1&1<<seq1:
-                nsign=0
-                for j in xrange(seq2):
-                    if rep&1<<j: nsign+=1
-                for j in xrange(seq1):
-                    if rep1&1<<j: nsign+=1
+                nsign=popcount(rep&((1<<seq2)-1))+popcount(rep1&((1<<seq1)-1))
                 rep2=rep1|1<<seq1
-                indices[ndata]=seq_basis(rep2,basis_table)
-                data[ndata]=(-1)**nsign
+                indices[ndata]=seq_basis_rank(rep2,basis_table,rank_table,rank_info)
+                data[ndata]=1-2*(nsign&1)
                 ndata+=1
     indptr[nbasis]=ndata
 
 def opt_rep_4(operator,basis,transpose,dtype=complex128):
     nbasis=basis.nbasis
     data=zeros(nbasis,dtype=dtype)
-    indices=zeros(nbasis,dtype=int32)
-    indptr=zeros(nbasis+1,dtype=int32)
+    indices=zeros(nbasis,dtype=index_dtype(nbasis))
+    indptr=zeros(nbasis+1,dtype=index_dtype(nbasis))
     seq1=operator.seqs[0]
     seq2=operator.seqs[1]
     seq3=operator.seqs[2]
     seq4=operator.seqs[3]
     basis_table=basis.basis_table
-    opt_rep_4_1100(data,indices,indptr,nbasis,basis_table,seq1,seq2,seq3,seq4)
+    rank_table=basis.rank_table
+    rank_info=basis.rank_info
+    opt_rep_4_1100(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2,seq3,seq4)
     if transpose==False:
         return csr_matrix((data*operator.value,indices,indptr),shape=(nbasis,nbasis))
     else:
         return csr_matrix((data*operator.value,indices,indptr),shape=(nbasis,nbasis)).T
 
 @jit
-def opt_rep_4_1100(data,indices,indptr,nbasis,basis_table,seq1,seq2,seq3,seq4):
+def opt_rep_4_1100(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2,seq3,seq4):
     ndata=0
     for i in xrange(nbasis):
         indptr[i]=ndata
-        rep=basis_rep(i,basis_table)
+        rep=basis_rep(i,basis_table,rank_info)
         if rep&1<<seq4:
             rep1=rep&~(1<<seq4)
             if rep1&1<<seq3:
@@ -219,17 +213,277 @@ def opt_rep_4_1100(data,indices,indptr,nbasis,basis_table,seq1,seq2,seq3,seq4):
                 if not rep2&1<<seq2:
                     rep3=rep2|1<<seq2
                     if not rep3&1<<seq1:
-                        nsign=0
-                        for j in xrange(seq4):
-                            if rep&1<<j: nsign+=1
-                        for j in xrange(seq3):
-                            if rep1&1<<j: nsign+=1
-                        for j in xrange(seq2):
-                            if rep2&1<<j: nsign+=1
-                        for j in xrange(seq1):
-                            if rep3&1<<j: nsign+=1
+                        nsign=popcount(rep&((1<<seq4)-1))+popcount(rep1&((1<<seq3)-1))+popcount(rep2&((1<<seq2)-1))+popcount(rep3&((1<<seq1)-1))
                         rep4=rep3|1<<seq1
-                        indices[ndata]=seq_basis(rep4,basis_table)
-                        data[ndata]=(-1)**nsign
+                        indices[ndata]=seq_basis_rank(rep4,basis_table,rank_table,rank_info)
+                        data[ndata]=1-2*(nsign&1)
                         ndata+=1
     indptr[nbasis]=ndata
+
+def opts_pack(operators):
+    '''
+    This function packs a list of operators together with their Hermitian conjugates into arrays for the fused kernels.
+    Parameters:
+        operators: list of Operator
+            The operators to be packed.
+    Returns:
+        ranks: 1D ndarray of integers
+            The ranks of the packed operators.
+        seqs,nambus: 2D ndarray of integers
+            The seqs and nambus of the indices of the packed operators, padded with zeros up to the maximum rank.
+        values: 1D ndarray of complex
+            The coefficients of the packed operators.
+    Note: the i-th operator is packed at 2*i and its Hermitian conjugate at 2*i+1.
+    '''
+    nopt=len(operators)
+    nrank=max([operator.rank for operator in operators]) if nopt>0 else 1
+    ranks=zeros(2*nopt,dtype=int64)
+    seqs=zeros((2*nopt,nrank),dtype=int64)
+    nambus=zeros((2*nopt,nrank),dtype=int64)
+    values=zeros(2*nopt,dtype=complex128)
+    for i,operator in enumerate(operators):
+        for j,opt in enumerate((operator,operator.dagger)):
+            ranks[2*i+j]=opt.rank
+            seqs[2*i+j,0:opt.rank]=opt.seqs
+            nambus[2*i+j,0:opt.rank]=[index.nambu for index in opt.indices]
+            values[2*i+j]=opt.value
+    return ranks,seqs,nambus,values
+
+def opts_dtype(operators):
+    '''
+    This function returns the minimal data type able to represent a list of operators, i.e. float64 when all the coefficients are real and complex128 otherwise.
+    Parameters:
+        operators: list of Operator
+            The operators.
+    Returns:
+        dtype.
+    '''
+    return float64 if all([abs(imag(operator.value))<RZERO for operator in operators]) else complex128
+
+def opts_rep(operators,basis,dtype=complex128):
+    '''
+    This function returns the csr-formed sparse matrix representation of the Hermitian operator, sum(operators)+h.c., on the occupation number basis.
+    All the operators and their Hermitian conjugates are applied to each basis state in a single pass, and the non-zero elements of each row are merged on the fly.
+    Parameters:
+        operators: list of Operator
+            The "half" operators, e.g. ONR.operators['h'].
+        basis: BasisE
+            The occupation number basis.
+        dtype: dtype, optional
+            The data type of the non-zero values of the returned sparse matrix.
+    Returns:
+        csr_matrix.
+    '''
+    indices,indptr,data=opts_rep_groups([operators],basis,dtype=dtype)
+    return csr_matrix((data[:,0],indices,indptr),shape=(basis.nbasis,basis.nbasis))
+
+def opts_rep_groups(groups,basis,dtype=complex128,nchunk=4096,splits=None):
+    '''
+    This function returns the sparse matrix representations of several groups of "half" operators which share the same sparsity pattern.
+    Parameters:
+        groups: list of list of Operator
+            The groups of operators, each of which represents the Hermitian operator, sum(group)+h.c..
+        basis: BasisE
+            The occupation number basis.
+        dtype: dtype, optional
+            The data type of the non-zero values.
+        nchunk: integer, optional
+            The number of rows in each chunk, which is the unit of work distributed among the threads.
+        splits: list of logical, optional
+            The flags to tag whether the operators of a group and their Hermitian conjugates are kept in two separate columns, which is necessary for a group scaled by a complex coefficient.
+            When it is None, no group is split.
+    Returns:
+        indices,indptr: 1D ndarray of int64
+            The csr-formed sparsity pattern shared by all the groups.
+        data: 2D ndarray
+            The non-zero values, whose columns belong to the groups in order, one column for a group not split and two columns, sum(group) followed by its h.c., for a group split.
+    Note:
+    1) The matrix of any linear combination of the groups is csr_matrix((dot(data,coefficients),indices,indptr)).
+       For a group split and scaled by c, the coefficients of its two columns are conjugate(c) and c respectively, since the conjugates of the coefficients are stored.
+    2) The exact number of non-zero elements of each row is counted in a first pass, so that the arrays are allocated only once with their final 64-bit sizes and each row is filled in place in a second pass.
+    '''
+    nbasis=basis.nbasis
+    operators=[operator for group in groups for operator in group]
+    ranks,seqs,nambus,values=opts_pack(operators)
+    splits=[False]*len(groups) if splits is None else splits
+    offsets=cumsum([0]+[2 if split else 1 for split in splits])
+    labels=concatenate([offsets[i]+(tile(array([0,1],dtype=int64),len(group)) if split else zeros(2*len(group),dtype=int64)) for i,(group,split) in enumerate(zip(groups,splits))]+[zeros(0,dtype=int64)])
+    if isinstance(basis,SymmetricBasisE): dtype=result_type(dtype,basis.chars.dtype)
+    indptr=zeros(nbasis+1,dtype=int64)
+    if isinstance(basis,SymmetricBasisE):
+        chars=basis.chars.astype(dtype)
+        sym_opts_rep_count(indptr,nbasis,nchunk,basis.basis_table,basis.perms,basis.holes,chars,ranks,seqs,nambus)
+    else:
+        opts_rep_count(indptr,nbasis,nchunk,basis.basis_table,basis.rank_table,basis.rank_info,ranks,seqs,nambus)
+    cumsum(indptr,out=indptr)
+    data=zeros((indptr[nbasis],offsets[-1]),dtype=dtype)
+    indices=zeros(indptr[nbasis],dtype=int64)
+    if isinstance(basis,SymmetricBasisE):
+        sym_opts_rep_fill(data,indices,indptr,nbasis,nchunk,basis.basis_table,basis.norms,basis.perms,basis.holes,chars,ranks,seqs,nambus,values.astype(dtype),labels)
+    else:
+        opts_rep_fill(data,indices,indptr,nbasis,nchunk,basis.basis_table,basis.rank_table,basis.rank_info,ranks,seqs,nambus,values.astype(dtype),labels)
+    return indices,indptr,data
+
+def opts_linear_operator(operators,basis,dtype=complex128):
+    '''
+    This function returns the matrix-free representation of the Hermitian operator, sum(operators)+h.c., on the occupation number basis.
+    No matrix is stored. Instead, the operators are applied directly to the input vector on the fly at every mat-vec.
+    Parameters:
+        operators: list of Operator
+            The "half" operators, e.g. ONR.operators['h'].
+        basis: BasisE
+            The occupation number basis.
+        dtype: dtype, optional
+            The data type of the operator.
+    Returns:
+        LinearOperator.
+    '''
+    nbasis=basis.nbasis
+    ranks,seqs,nambus,values=opts_pack(operators)
+    if isinstance(basis,SymmetricBasisE): dtype=result_type(dtype,basis.chars.dtype)
+    values=values.astype(dtype)
+    def matvec(vector):
+        vector=asarray(vector).ravel()
+        result=zeros(nbasis,dtype=result_type(vector.dtype,values.dtype))
+        if isinstance(basis,SymmetricBasisE):
+            sym_opts_matvec(result,vector,nbasis,basis.basis_table,basis.norms,basis.perms,basis.holes,basis.chars.astype(values.dtype),ranks,seqs,nambus,values)
+        else:
+            opts_matvec(result,vector,nbasis,basis.basis_table,basis.rank_table,basis.rank_info,ranks,seqs,nambus,values)
+        return result
+    return LinearOperator((nbasis,nbasis),matvec=matvec,rmatvec=matvec,dtype=dtype)
+
+@jit(nopython=True,parallel=True)
+def opts_matvec(result,vector,nbasis,basis_table,rank_table,rank_info,ranks,seqs,nambus,values):
+    for i in prange(nbasis):
+        rep=basis_rep(i,basis_table,rank_info)
+        buff=result[i]
+        for p in xrange(len(ranks)):
+            nrep,sign=opt_act(rep,ranks[p],seqs[p],nambus[p])
+            if sign!=0:
+                buff+=values[p].conjugate()*sign*vector[seq_basis_rank(nrep,basis_table,rank_table,rank_info)]
+        result[i]=buff
+
+@jit(nopython=True,parallel=True)
+def sym_opts_matvec(result,vector,nbasis,basis_table,norms,perms,holes,chars,ranks,seqs,nambus,values):
+    for i in prange(nbasis):
+        rep=basis_table[i]
+        buff=result[i]
+        for p in xrange(len(ranks)):
+            nrep,sign=opt_act(rep,ranks[p],seqs[p],nambus[p])
+            if sign!=0:
+                nrep,factor=sym_rep(nrep,perms,holes,chars)
+                seq=seq_basis_find(nrep,basis_table)
+                if seq>=0:
+                    buff+=(values[p]*sign*factor).conjugate()*sqrt(norms[seq]/norms[i])*vector[seq]
+        result[i]=buff
+
+@jit
+def opt_act(rep,rank,seqs,nambus):
+    '''
+    This function applies an operator, described by its rank, seqs and nambus, onto a binary basis.
+    Returns:
+        rep: integer
+            The resulting binary basis.
+        sign: integer
+            The fermionic sign, which is 0 when the result vanishes.
+    '''
+    nsign=0
+    for k in xrange(rank-1,-1,-1):
+        seq=seqs[k]
+        if nambus[k]==CREATION:
+            if rep&1<<seq: return rep,0
+        else:
+            if not rep&1<<seq: return rep,0
+        nsign+=popcount(rep&((1<<seq)-1))
+        rep=rep^(1<<seq)
+    return rep,1-2*(nsign&1)
+
+@jit
+def row_find(indices,start,ndata,seq):
+    '''
+    This function returns the position of seq in the sorted indices[start:start+ndata], or the position where it should be inserted when it is absent.
+    '''
+    k=start+ndata
+    while k>start and indices[k-1]>=seq: k-=1
+    return k
+
+@jit
+def row_count(buff,ndata,seq):
+    '''
+    This function inserts seq into the sorted scratch buff[0:ndata] when it is absent, and returns the new number of distinct entries.
+    '''
+    k=row_find(buff,0,ndata,seq)
+    if k<ndata and buff[k]==seq: return ndata
+    for l in xrange(ndata,k,-1): buff[l]=buff[l-1]
+    buff[k]=seq
+    return ndata+1
+
+@jit
+def row_fill(data,indices,start,ndata,seq,label,value):
+    '''
+    This function adds value to the entry seq of the group label in the row stored from start with ndata sorted entries, and returns the new number of entries.
+    '''
+    k=row_find(indices,start,ndata,seq)
+    if k<start+ndata and indices[k]==seq:
+        data[k,label]+=value
+        return ndata
+    for l in xrange(start+ndata,k,-1):
+        indices[l]=indices[l-1]
+        for g in xrange(data.shape[1]): data[l,g]=data[l-1,g]
+    indices[k]=seq
+    for g in xrange(data.shape[1]): data[k,g]=0
+    data[k,label]=value
+    return ndata+1
+
+@jit(nopython=True,parallel=True)
+def opts_rep_count(indptr,nbasis,nchunk,basis_table,rank_table,rank_info,ranks,seqs,nambus):
+    for c in prange((nbasis+nchunk-1)//nchunk):
+        buff=zeros(len(ranks)+1,dtype=int64)
+        for i in xrange(c*nchunk,min(c*nchunk+nchunk,nbasis)):
+            rep=basis_rep(i,basis_table,rank_info)
+            ndata=0
+            for p in xrange(len(ranks)):
+                nrep,sign=opt_act(rep,ranks[p],seqs[p],nambus[p])
+                if sign!=0: ndata=row_count(buff,ndata,seq_basis_rank(nrep,basis_table,rank_table,rank_info))
+            indptr[i+1]=ndata
+
+@jit(nopython=True,parallel=True)
+def sym_opts_rep_count(indptr,nbasis,nchunk,basis_table,perms,holes,chars,ranks,seqs,nambus):
+    for c in prange((nbasis+nchunk-1)//nchunk):
+        buff=zeros(len(ranks)+1,dtype=int64)
+        for i in xrange(c*nchunk,min(c*nchunk+nchunk,nbasis)):
+            rep=basis_table[i]
+            ndata=0
+            for p in xrange(len(ranks)):
+                nrep,sign=opt_act(rep,ranks[p],seqs[p],nambus[p])
+                if sign!=0:
+                    nrep,factor=sym_rep(nrep,perms,holes,chars)
+                    seq=seq_basis_find(nrep,basis_table)
+                    if seq>=0: ndata=row_count(buff,ndata,seq)
+            indptr[i+1]=ndata
+
+@jit(nopython=True,parallel=True)
+def opts_rep_fill(data,indices,indptr,nbasis,nchunk,basis_table,rank_table,rank_info,ranks,seqs,nambus,values,labels):
+    for c in prange((nbasis+nchunk-1)//nchunk):
+        for i in xrange(c*nchunk,min(c*nchunk+nchunk,nbasis)):
+            rep=basis_rep(i,basis_table,rank_info)
+            ndata=0
+            for p in xrange(len(ranks)):
+                nrep,sign=opt_act(rep,ranks[p],seqs[p],nambus[p])
+                if sign!=0:
+                    seq=seq_basis_rank(nrep,basis_table,rank_table,rank_info)
+                    ndata=row_fill(data,indices,indptr[i],ndata,seq,labels[p],values[p].conjugate()*sign)
+
+@jit(nopython=True,parallel=True)
+def sym_opts_rep_fill(data,indices,indptr,nbasis,nchunk,basis_table,norms,perms,holes,chars,ranks,seqs,nambus,values,labels):
+    for c in prange((nbasis+nchunk-1)//nchunk):
+        for i in xrange(c*nchunk,min(c*nchunk+nchunk,nbasis)):
+            rep=basis_table[i]
+            ndata=0
+            for p in xrange(len(ranks)):
+                nrep,sign=opt_act(rep,ranks[p],seqs[p],nambus[p])
+                if sign!=0:
+                    nrep,factor=sym_rep(nrep,perms,holes,chars)
+                    seq=seq_basis_find(nrep,basis_table)
+                    if seq<0: continue
+                    ndata=row_fill(data,indices,indptr[i],ndata,seq,labels[p],(values[p]*sign*factor).conjugate()*sqrt(norms[seq]/norms[i]))
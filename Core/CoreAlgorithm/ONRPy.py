@@ -7,10 +7,14 @@ from Hamiltonian.Core.BasicClass.BasisEPy import *
 from Hamiltonian.Core.BasicClass.OperatorRepresentationPy import *
 from Hamiltonian.Core.BasicAlgorithm.LanczosPy import *
 from scipy.sparse.linalg import eigsh
-from scipy.linalg import solve_banded,solveh_banded
+from scipy.linalg import solve_banded,solveh_banded,eigh
+from numpy.linalg import inv
 from copy import deepcopy
 import matplotlib.pyplot as plt
-import os.path,sys
+from multiprocessing import Pool,cpu_count
+from itertools import imap,izip
+from numpy.lib.format import open_memmap
+import os.path,sys,itertools
 class ONR(Engine):
     '''
     The class ONR provides the methods to get the sparse matrix representation on the occupation number basis of an electron system. Apart from those inherited from its parent class Engine, it has the following attributes:
@@ -27,11 +31,16 @@ class ONR(Engine):
     10) operators: a dict containing different groups of operators for diverse tasks, which generally has two entries:
         (1) entry 'h' includes "half" the operators of the Hamiltonian, and
         (2) entry 'sp' includes all the single-particle operators;
-    11) matrix: the sparse matrix representation of the system;
-    12) cache: the cache during the process of calculation.
+    11) matrix: the sparse matrix representation of the system, which is a LinearOperator in the matrix-free mode;
+    12) matrix_free: a flag to tag whether the Hamiltonian is applied on the fly instead of being stored as a sparse matrix;
+    13) symmetry: a flag to tag whether the translation symmetry of a periodic cluster is used to find the ground state;
+    14) spinflip: the parity of the ground state under the spin flip, 1 or -1, 'auto' to find it automatically, or None if the spin-flip symmetry is not used;
+    15) particlehole: the parity of the ground state under the particle-hole transformation c_i->eta_i*c_i^dagger with eta_i=+1/-1 on the two sublattices, 1 or -1, 'auto' to find it automatically, or None if the particle-hole symmetry is not used;
+    16) sector: the symmetry-adapted basis of the ground state sector, which is None when no symmetry is used;
+    17) cache: the cache during the process of calculation.
     '''
 
-    def __init__(self,ensemble='c',filling=0.5,mu=0,basis=None,nspin=1,lattice=None,terms=None,nambu=False,**karg):
+    def __init__(self,ensemble='c',filling=0.5,mu=0,basis=None,nspin=1,lattice=None,terms=None,nambu=False,matrix_free=False,symmetry=False,spinflip=None,particlehole=None,**karg):
         self.ensemble=ensemble
         self.filling=filling
         self.mu=mu
@@ -44,6 +53,11 @@ class ONR(Engine):
         self.lattice=lattice
         self.terms=terms
         self.nambu=nambu
+        self.matrix_free=matrix_free
+        self.symmetry=symmetry
+        self.spinflip=spinflip
+        self.particlehole=particlehole
+        self.sector=None
         self.generators={}
         self.generators['h']=Generator(bonds=lattice.bonds,table=lattice.table(nambu=False),terms=terms,nambu=False,half=True)
         self.name.update(const=self.generators['h'].parameters['const'])
@@ -81,19 +95,243 @@ class ONR(Engine):
         self.name.update(alter=self.generators['h'].parameters['alter'])
         self.set_operators_hamiltonian()
 
-    def set_matrix(self):
+    def set_matrix(self,cache=False):
         '''
-        Set the csc_matrix representation of the Hamiltonian.
+        Set the csr_matrix representation of the Hamiltonian.
+        All the operators in self.operators['h'] and their Hermitian conjugates are assembled in a single pass over the basis.
+        In the matrix-free mode, a LinearOperator which applies these operators on the fly is set instead.
+        When self.sector is not None, the matrix is that of the symmetry sector instead of the whole basis.
+        When all the coefficients are real, the matrix is of float64 instead of complex128.
+        Parameters:
+            cache: logical, optional
+                True for caching the sparse matrices of the constant terms and of each alterable term with a shared sparsity pattern, so that after an update only their linear combination is recomputed.
+                Each alterable term O+O^dagger is cached as O and O^dagger separately, so that a complex coefficient c gives c*O+conjugate(c)*O^dagger.
+                It is meant for scans of the alterable parameters, e.g. in ONREB, since the cache takes one column of data per alterable term.
+                False for building the matrix directly and releasing the cache, if any.
         '''
-        self.matrix=csr_matrix((self.basis.nbasis,self.basis.nbasis),dtype=complex128)
+        basis=self.basis if self.sector is None else self.sector
+        if self.matrix_free:
+            self.matrix=opts_linear_operator(self.operators['h'],basis,dtype=opts_dtype(self.operators['h']))
+        elif not cache:
+            self.cache.pop('matrix',None)
+            self.matrix=opts_rep(self.operators['h'],basis,dtype=opts_dtype(self.operators['h']))
+        else:
+            generator=self.generators['h']
+            cache=self.cache.get('matrix',None)
+            if cache is None or cache['basis'] is not basis or any([norm(array(value)-array(generator.parameters['alter'][key]))>RZERO for key,value in cache['values'].iteritems()]):
+                cache={'basis':basis,'keys':[],'values':{}}
+                groups=[list(generator.cache['const'])]
+                for key in generator.terms['alter']:
+                    buff=generator.unit_operators(key)
+                    if buff is None:
+                        groups[0].extend(generator.cache['alter'][key])
+                        cache['values'][key]=deepcopy(generator.parameters['alter'][key])
+                    else:
+                        groups.append(buff)
+                        cache['keys'].append(key)
+                cache['indices'],cache['indptr'],cache['data']=opts_rep_groups(groups,basis,dtype=opts_dtype([operator for group in groups for operator in group]),splits=[False]+[True]*len(cache['keys']))
+                self.cache['matrix']=cache
+            coefficients=array([1.0]+[value for key in cache['keys'] for value in (conjugate(generator.parameters['alter'][key]),generator.parameters['alter'][key])],dtype=complex128)
+            if all(abs(coefficients.imag)<RZERO): coefficients=coefficients.real
+            self.matrix=csr_matrix((dot(cache['data'],coefficients),cache['indices'],cache['indptr']),shape=(basis.nbasis,basis.nbasis))
+
+    def translation_group(self):
+        '''
+        Return the translation group of the cluster and its irreducible representations.
+        Returns:
+            perms: 2D ndarray of integers
+                The translations as permutations of the orbitals, i.e. the sequences in self.generators['h'].table.
+            irreps: list of 2-tuple
+                For each tuple:
+                    tuple[0]: 1D ndarray
+                        The momentum k.
+                    tuple[1]: 1D ndarray
+                        The characters exp(-1j*k*t) of the translations t.
+        '''
+        table=self.generators['h'].table
+        translations=self.lattice.translations()
+        keys={(str(point.scope),point.site):key for key,point in self.lattice.points.iteritems()}
+        perms=zeros((len(translations),len(table)),dtype=int64)
+        for g,(translation,images) in enumerate(translations):
+            for index,seq in table.iteritems():
+                point=self.lattice.points[images[keys[(index.scope,index.site)]]]
+                perms[g,seq]=table[Index(site=point.site,orbital=index.orbital,spin=index.spin,nambu=index.nambu,scope=point.scope)]
+        ts=array([translation for translation,images in translations])
+        bs=array(self.lattice.reciprocals) if self.lattice.reciprocals is not None else zeros((0,ts.shape[1]))
+        irreps,records=[],set()
+        for ms in itertools.product(xrange(len(translations)),repeat=len(bs)):
+            k=dot(array(ms,dtype=float64),bs) if len(bs)>0 else zeros(ts.shape[1])
+            chars=exp(-1j*dot(ts,k))
+            record=tuple(around(chars,6).tolist())
+            if record not in records:
+                records.add(record)
+                irreps.append((k,chars))
+        return perms,irreps
+
+    def sublattice(self):
+        '''
+        Return the signs eta of the orbitals on the two sublattices of a bipartite cluster, which are determined by the nearest neighbour bonds.
+        Returns:
+            result: 1D ndarray of integers
+                The signs of the orbitals, i.e. the sequences in self.generators['h'].table.
+        '''
+        colors,neighbours={},{}
+        for bond in self.lattice.bonds:
+            if bond.neighbour==1:
+                p,q=(str(bond.spoint.scope),bond.spoint.site),(str(bond.epoint.scope),bond.epoint.site)
+                neighbours.setdefault(p,set()).add(q)
+                neighbours.setdefault(q,set()).add(p)
+        for point in self.lattice.points.itervalues():
+            key=(str(point.scope),point.site)
+            if key in colors: continue
+            colors[key]=1
+            stack=[key]
+            while stack:
+                p=stack.pop()
+                for q in neighbours.get(p,()):
+                    if q not in colors:
+                        colors[q]=-colors[p]
+                        stack.append(q)
+                    elif colors[q]==colors[p]:
+                        raise ValueError('ONR sublattice error: the cluster is not bipartite.')
+        table=self.generators['h'].table
+        result=zeros(len(table),dtype=int64)
+        for index,seq in table.iteritems():
+            result[seq]=colors[(index.scope,index.site)]
+        return result
+
+    def symmetry_group(self):
+        '''
+        Return the symmetry group used to find the ground state and its irreducible representations.
+        The group is the direct product of the translations when self.symmetry is True, the spin flip when self.spinflip is not None and the particle-hole transformation when self.particlehole is not None.
+        Returns:
+            perms: 2D ndarray of integers
+                The orbital permutations of the group elements.
+            holes: 2D ndarray of integers
+                The particle-hole parts of the group elements.
+            irreps: list of 2-tuple
+                For each tuple:
+                    tuple[0]: tuple
+                        The label of the irreducible representation, i.e. (k,spin-flip parity,particle-hole parity).
+                    tuple[1]: 1D ndarray
+                        The characters of the group elements.
+        '''
+        table=self.generators['h'].table
+        nstate,nparticle,basis_type=self.basis.nstate,self.basis.nparticle,self.basis.basis_type.lower()
+        if self.symmetry:
+            tperms,tirreps=self.translation_group()
+        else:
+            tperms,tirreps=arange(len(table),dtype=int64)[newaxis,:],[(None,ones(1))]
+        fperms=[arange(len(table),dtype=int64)]
+        if self.spinflip is not None:
+            if basis_type=='es' and (nstate[0]!=nstate[1] or nparticle[0]!=nparticle[1]):
+                raise ValueError('ONR symmetry_group error: the spin flip does not conserve the basis.')
+            buff=zeros(len(table),dtype=int64)
+            for index,seq in table.iteritems():
+                buff[seq]=table[Index(site=index.site,orbital=index.orbital,spin=1-index.spin,nambu=index.nambu,scope=index.scope)]
+            fperms.append(buff)
+        hflags=[0]+([1] if self.particlehole is not None else [])
+        perms=array([fperm[tperm] for fperm in fperms for tperm in tperms for flag in hflags],dtype=int64)
+        holes=zeros(perms.shape,dtype=int64)
+        if self.particlehole is not None:
+            if (basis_type=='ep' and 2*nparticle!=nstate) or (basis_type=='es' and (2*nparticle[0]!=nstate[0] or 2*nparticle[1]!=nstate[1])):
+                raise ValueError('ONR symmetry_group error: the particle-hole transformation does not conserve the basis.')
+            eta=self.sublattice()
+            if prod(eta)*(-1)**(len(eta)*(len(eta)-1)/2)!=1:
+                raise ValueError('ONR symmetry_group error: the particle-hole transformation squares to -1 for this cluster.')
+            for perm in perms:
+                if any(eta[perm]!=eta) or permutation_parity(perm)!=0:
+                    raise ValueError('ONR symmetry_group error: the particle-hole transformation does not commute with the other symmetries.')
+            holes[1::2,:]=eta
+        fparities=[None] if self.spinflip is None else ([1,-1] if self.spinflip=='auto' else [self.spinflip])
+        hparities=[None] if self.particlehole is None else ([1,-1] if self.particlehole=='auto' else [self.particlehole])
+        irreps=[]
+        for k,tchars in tirreps:
+            for fparity in fparities:
+                for hparity in hparities:
+                    chars=array([tchar*(fparity if f==1 else 1)*(hparity if h==1 else 1) for f in xrange(len(fperms)) for tchar in tchars for h in hflags])
+                    irreps.append(((k,fparity,hparity),chars))
+        self.check_symmetry(perms,holes)
+        return perms,holes,irreps
+
+    def check_symmetry(self,perms,holes):
+        '''
+        Check whether the Hamiltonian is invariant under a group of orbital permutations and particle-hole transformations.
+        Every operator of the Hamiltonian is transformed and normal ordered, and the Hamiltonian is invariant when the difference is a combination of the conserved quantities of the basis, i.e. a constant and the particle numbers.
+        Parameters:
+            perms: 2D ndarray of integers
+                The orbital permutations of the group elements.
+            holes: 2D ndarray of integers
+                The particle-hole parts of the group elements.
+        '''
+        table=self.generators['h'].table
+        basis_type=self.basis.basis_type.lower()
+        species=zeros(len(table),dtype=int64)
+        if basis_type=='es':
+            for index,seq in table.iteritems(): species[seq]=index.spin
+        origin={}
         for operator in self.operators['h']:
-            self.matrix+=opt_rep(operator,self.basis,transpose=False)
-        self.matrix+=conjugate(transpose(self.matrix))
-        self.matrix=transpose(self.matrix)
+            for opt in (operator,operator.dagger):
+                onr_normal_order([(seq,index.nambu==CREATION) for seq,index in zip(opt.seqs,opt.indices)],opt.value,origin)
+        for perm,hole in zip(perms,holes):
+            image={}
+            for operator in self.operators['h']:
+                for opt in (operator,operator.dagger):
+                    factors,value=[],opt.value
+                    for seq,index in zip(opt.seqs,opt.indices):
+                        value*=hole[seq] if hole[seq]!=0 else 1
+                        factors.append((perm[seq],(index.nambu==CREATION)!=(hole[seq]!=0)))
+                    onr_normal_order(factors,value,image)
+            diff={}
+            for key in set(origin.keys())|set(image.keys()):
+                buff=image.get(key,0)-origin.get(key,0)
+                if len(key)>0 and abs(buff)>RZERO: diff[key]=buff
+            if basis_type!='eg':
+                for spec in set(species):
+                    seqs=nonzero(species==spec)[0]
+                    values=array([diff.pop(((seq,True),(seq,False)),0) for seq in seqs])
+                    if abs(values-values[0]).max()>RZERO:
+                        raise ValueError('ONR check_symmetry error: the Hamiltonian is not invariant under the symmetry group.')
+            if len(diff)>0:
+                raise ValueError('ONR check_symmetry error: the Hamiltonian is not invariant under the symmetry group.')
+
+    def set_sector(self,**karg):
+        '''
+        Set self.sector to be the symmetry sector where the ground state lives, and self.matrix accordingly.
+        The lowest eigenvalue of every allowed sector is computed and the lowest one is chosen.
+        Note: self.sector stays set until it is reset to None, e.g. by ONRGFC once the ground state is found, and until then set_matrix builds the matrix of this sector only.
+        Parameters:
+            karg: dict, optional
+                The settings passed to trlanczos, e.g. vtype, nkrylov, reorth, tol and maxiter.
+        Returns:
+            gse: float
+                The ground state energy.
+            gs: 1D ndarray
+                The ground state in the chosen sector.
+        '''
+        perms,holes,irreps=self.symmetry_group()
+        best=None
+        for label,chars in irreps:
+            self.sector=SymmetricBasisE(self.basis,perms,chars,holes)
+            if self.sector.nbasis==0: continue
+            self.set_matrix()
+            w,v,info=trlanczos(self.matrix,k=1,dtype=self.matrix.dtype,**karg)
+            if not info['converged']:
+                self.sector=None
+                raise ValueError('ONR set_sector error: the lowest state of the sector %s is not converged, residual: %s.'%(label,info['residuals'][0]))
+            if best is None or w[0]<best[0]-RZERO: best=(w[0],v[:,0],self.sector,label)
+        print 'Ground state sector: (k,spinflip,particlehole)=%s, nbasis=%s.'%(best[3],best[2].nbasis)
+        self.sector=best[2]
+        self.set_matrix()
+        return best[0],best[1]
 
     def gf(self,omega=None):
         '''
         Return the single particle Green's function of the system.
+        Parameters:
+            omega: number or 1D ndarray, optional
+                The frequency or frequencies of the Green's function.
+                When it is an array, the Green's functions at all the frequencies are evaluated at once and stacked along the first axis.
         '''
         if not 'GF' in self.apps:
             self.addapps(app=GF((len(self.operators['sp']),len(self.operators['sp'])),run=ONRGF))
@@ -109,104 +347,353 @@ class ONR(Engine):
         if 'gf_mesh' in self.cache:
             return self.cache['gf_mesh']
         else:
-            result=zeros((omegas.shape[0],len(self.operators['sp']),len(self.operators['sp'])),dtype=complex128)
-            for i,omega in enumerate(omegas):
-                result[i,:,:]=self.gf(omega)
+            result=copy(self.gf(asarray(omegas)))
             self.cache['gf_mesh']=result
             return result
 
+def onr_normal_order(factors,value,result):
+    '''
+    This function normal orders a product of fermionic operators with the anticommutation relations, and adds the terms to result.
+    Parameters:
+        factors: list of 2-tuple
+            The factors of the product in order, each of which is (seq,creation) with creation a flag to tag whether the factor is a creation operator.
+        value: number
+            The coefficient of the product.
+        result: dict
+            The normal ordered terms, whose keys are the tuples of the factors, with the creation operators first and the seqs ascending, and values are the coefficients.
+    '''
+    for k in xrange(len(factors)-1):
+        (a,ca),(b,cb)=factors[k],factors[k+1]
+        if (not ca,a)>(not cb,b):
+            onr_normal_order(factors[:k]+[factors[k+1],factors[k]]+factors[k+2:],-value,result)
+            if a==b: onr_normal_order(factors[:k]+factors[k+2:],value,result)
+            return
+        elif (a,ca)==(b,cb):
+            return
+    key=tuple(factors)
+    result[key]=result.get(key,0)+value
+
 def ONRGFC(engine,app):
+    '''
+    This function calculates the Lanczos coefficients of the single particle Green's function.
+    When app.save_data is True, the coefficients are stored in the directory engine.din/engine.name.full_GFC/, which contains:
+        meta.npz: the metadata, i.e. the method, nstep, the basis, the ordering of the single particle operators, the parameter digest and the ground state energy;
+        gs.npy: the ground state;
+        coeff.npy: the coefficients, which are written chain by chain through a memory map;
+        done.npy: the mask of the finished chains.
+    A later run with the same metadata resumes from the unfinished chains, and reads the coefficients through a read-only memory map once all of them are finished.
+    '''
     nopt=len(engine.operators['sp'])
-    if os.path.isfile(engine.din+'/'+engine.name.full+'_coeff.dat'):
-        with open(engine.din+'/'+engine.name.full+'_coeff.dat','rb') as fin:
-            app.gse=fromfile(fin,count=1)
-            app.coeff=fromfile(fin,dtype=complex128)
-        if len(app.coeff)==nopt*nopt*2*3*app.nstep:
-            app.coeff=app.coeff.reshape((nopt,nopt,2,3,app.nstep))
-            return
-    app.coeff=zeros((nopt,nopt,2,3,app.nstep),dtype=complex128)
-    engine.set_matrix()
-    app.gse,gs=Lanczos(engine.matrix,vtype=app.vtype).eig(job='v')
-    print 'gse:',app.gse
-    if engine.basis.basis_type.lower() in ('es','ep'): engine.matrix=None
+    if app.method=='S':
+        shape,dshape=(nopt,nopt,2,3,app.nstep),(nopt,nopt,2)
+        tasks=[[(i,j,h) for j in xrange(nopt) for i in xrange(nopt) if not (engine.basis.basis_type.lower()=='es' and engine.nspin==2 and engine.operators['sp'][j].indices[0].spin!=engine.operators['sp'][i].indices[0].spin)] for h in xrange(2)]
+        key=lambda task: task
+    else:
+        shape,dshape=(2,3,app.nstep,nopt,nopt),(2,nopt)
+        if engine.basis.basis_type.lower()=='es' and engine.nspin==2:
+            groups=[[i for i,opt in enumerate(engine.operators['sp']) if opt.indices[0].spin==spin] for spin in (0,1)]
+        else:
+            groups=[range(nopt)]
+        tasks=[[(h,group) for group in groups if len(group)>0] for h in xrange(2)]
+        key=lambda task: (task[0],task[1][0])
+    dname=engine.din+'/'+engine.name.full+'_GFC/'
+    meta=onr_gfc_meta(engine,app)
+    done=None
+    if all([os.path.isfile(dname+fname) for fname in ('meta.npz','gs.npy','coeff.npy','done.npy')]):
+        fin=load(dname+'meta.npz')
+        old=dict((name,fin[name]) for name in fin.files)
+        fin.close()
+        if all([name in old and array_equal(old[name],value) for name,value in meta.iteritems()]):
+            app.gse=old['gse'][()]
+            done=load(dname+'done.npy',mmap_mode='r+') if app.save_data else load(dname+'done.npy')
+            if done.all():
+                app.coeff=load(dname+'coeff.npy',mmap_mode='r')
+                if app.method=='Q': onr_qmatrix(app)
+                return
+            app.coeff=load(dname+'coeff.npy',mmap_mode='r+') if app.save_data else load(dname+'coeff.npy')
+            gs=load(dname+'gs.npy')
+            print 'gse:',app.gse
+            print 'Resumed:',done.sum(),'of',done.size,'chains finished.'
+            if engine.basis.basis_type.lower()=='eg': engine.set_matrix()
+    if done is None:
+        if engine.symmetry or engine.spinflip is not None or engine.particlehole is not None:
+            app.gse,gs=engine.set_sector(vtype=app.vtype)
+            gs=engine.sector.expand(gs)
+            engine.sector=None
+            if engine.basis.basis_type.lower()=='eg': engine.set_matrix()
+            print 'gse:',app.gse
+        else:
+            engine.set_matrix()
+            w,v,info=trlanczos(engine.matrix,k=1,vtype=app.vtype,dtype=engine.matrix.dtype)
+            app.gse,gs=w[0],v[:,0]
+            print 'gse:',app.gse
+            if not info['converged']: print 'Warning: the ground state is not converged, residual:',info['residuals'][0]
+        if engine.basis.basis_type.lower() in ('es','ep'):
+            engine.matrix=None
+            engine.cache.pop('matrix',None)
+        if app.save_data:
+            if not os.path.isdir(dname): os.makedirs(dname)
+            save(dname+'gs.npy',gs)
+            savez(dname+'meta.npz',gse=app.gse,**meta)
+            app.coeff=open_memmap(dname+'coeff.npy',mode='w+',dtype=complex128,shape=shape)
+            done=open_memmap(dname+'done.npy',mode='w+',dtype=bool,shape=dshape)
+        else:
+            app.coeff=zeros(shape,dtype=complex128)
+            done=zeros(dshape,dtype=bool)
+        done[...]=True
+        for task in tasks[0]+tasks[1]: done[key(task)]=False
+        if app.save_data: done.flush()
+    sectors={}
+    ONR_GFC_SHARED.update(engine=engine,app=app,gs=gs,sectors=sectors)
     for h in xrange(2):
         if h==0: print 'Electron part:'
-        else: print 'Hole part:' 
-        for j,optb in enumerate(engine.operators['sp']):
-            for i,opta in enumerate(engine.operators['sp']):
-                if engine.basis.basis_type.lower()=='es' and engine.nspin==2 and optb.indices[0].spin!=opta.indices[0].spin : continue
-                mask=False
-                if j==i and j==0 : mask=True
-                if engine.basis.basis_type.lower()=='es' and engine.nspin==2 and j==i and j==nopt/2: mask=True
-                if h==0:
-                    if mask: onr=onr_eh(engine,optb.indices[0].dagger)
-                    matj=opt_rep(optb.dagger,[engine.basis,onr.basis],transpose=True)
-                    mati=opt_rep(opta.dagger,[engine.basis,onr.basis],transpose=True)
-                else:
-                    if mask: onr=onr_eh(engine,optb.indices[0])
-                    matj=opt_rep(opta,[engine.basis,onr.basis],transpose=True)
-                    mati=opt_rep(optb,[engine.basis,onr.basis],transpose=True)
-                statei=mati.dot(gs)
-                statej=matj.dot(gs)
-                normj=norm(statej)
-                statej[:]=statej[:]/normj
-                lcz=Lanczos(onr.matrix,statej)
-                for k in xrange(app.nstep):
-                    if not lcz.cut:
-                        app.coeff[i,j,h,0,k]=vdot(statei,statej)*normj
-                        lcz.iter()
-                app.coeff[i,j,h,1,0:len(lcz.a)]=array(lcz.a)
-                app.coeff[i,j,h,2,0:len(lcz.b)]=array(lcz.b)
+        else: print 'Hole part:'
+        htasks=[task for task in tasks[h] if not done[key(task)]]
+        if app.parallel:
+            for task in htasks: onr_gfc_sector(task)
+            pool=Pool(processes=app.np if app.np>0 else cpu_count())
+            results=pool.imap(onr_gfc_chain,htasks)
+        else:
+            pool=None
+            results=imap(onr_gfc_chain,htasks)
+        for task,result in izip(htasks,results):
+            if app.method=='S':
+                i,j,h=task
+                app.coeff[i,j,h,0,:]=result[0]
+                app.coeff[i,j,h,1,0:len(result[1])]=result[1]
+                app.coeff[i,j,h,2,0:len(result[2])]=result[2]
                 print j*nopt+i,'...',
-                sys.stdout.flush()
+            else:
+                h,group=task
+                block=ix_(group,group)
+                app.coeff[h,0,0][block]=result[0]
+                for k in xrange(len(result[1])):
+                    app.coeff[h,1,k][block]=result[1][k]
+                    app.coeff[h,2,k][block]=result[2][k]
+                print len(result[1]),'...',
+            if app.save_data: app.coeff.flush()
+            done[key(task)]=True
+            if app.save_data: done.flush()
+            sys.stdout.flush()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        sectors.clear()
         print
+    ONR_GFC_SHARED.clear()
     if app.save_data:
-        with open(engine.din+'/'+engine.name.full+'_coeff.dat','wb') as fout:
-            array(app.gse).tofile(fout)
-            app.coeff.tofile(fout)
-
-def onr_eh(self,index):
-    if self.basis.basis_type.lower()=='eg':
-        return self
-    elif self.basis.basis_type.lower()=='ep':
-        result=deepcopy(self)
-        if index.nambu==CREATION:
-            result.basis=BasisE((self.basis.nstate,self.basis.nparticle+1))
+        del app.coeff,done
+        app.coeff=load(dname+'coeff.npy',mmap_mode='r')
+    if app.method=='Q': onr_qmatrix(app)
+
+def onr_gfc_meta(engine,app):
+    '''
+    This function returns the metadata which identifies the Lanczos coefficients of the single particle Green's function.
+    Parameters:
+        engine: ONR
+            The engine.
+        app: GFC
+            The app.
+    Returns:
+        result: dict
+            The metadata.
+    '''
+    result={}
+    result['method']=array(app.method)
+    result['nstep']=array(app.nstep)
+    result['basis_type']=array(engine.basis.basis_type)
+    result['nstate']=array(engine.basis.nstate)
+    result['nparticle']=array(engine.basis.nparticle)
+    result['parity']=array(-1 if engine.basis.parity is None else engine.basis.parity)
+    result['operators']=array([repr(opt.indices[0]) for opt in engine.operators['sp']])
+    result['digest']=array(engine.name.digest)
+    return result
+
+ONR_GFC_SHARED={}
+
+def onr_gfc_sector(task):
+    '''
+    This function returns the basis and the Hamiltonian of the sector where the Lanczos chain specified by task lives.
+    Parameters:
+        task: tuple
+            (i,j,h) for the scalar chain of the (i,j)-th matrix element of the electron (h=0) or hole (h=1) part of the Green's function, and
+            (h,group) for the block chain of the single particle operators in group.
+    Returns:
+        basis: BasisE
+            The basis of the sector.
+        matrix: csr_matrix or LinearOperator
+            The Hamiltonian of the sector.
+    '''
+    engine,app,sectors=ONR_GFC_SHARED['engine'],ONR_GFC_SHARED['app'],ONR_GFC_SHARED['sectors']
+    if app.method=='S':
+        opt,h=engine.operators['sp'][task[1]],task[2]
+    else:
+        opt,h=engine.operators['sp'][task[1][0]],task[0]
+    return onr_eh(engine,opt.indices[0].dagger if h==0 else opt.indices[0],sectors)
+
+def onr_gfc_chain(task):
+    '''
+    This function runs the Lanczos chain specified by task.
+    All the other inputs, i.e. the engine, the app, the ground state and the sectors, are read from the module-level dict ONR_GFC_SHARED.
+    In the parallel mode, it is filled and all the sectors are built before the process pool is forked, so that the workers share them read-only without any pickling.
+    Parameters:
+        task: tuple
+            See onr_gfc_sector.
+    Returns:
+        For the scalar chain, the 1D arrays of the overlaps, the a's and the b's;
+        For the block chain, the r0 block and the 3D arrays of the a blocks and the b blocks.
+    '''
+    engine,app,gs=ONR_GFC_SHARED['engine'],ONR_GFC_SHARED['app'],ONR_GFC_SHARED['gs']
+    basis,matrix=onr_gfc_sector(task)
+    if app.method=='S':
+        i,j,h=task
+        opta,optb=engine.operators['sp'][i],engine.operators['sp'][j]
+        if h==0:
+            matj=opt_rep(optb.dagger,[engine.basis,basis],transpose=True,dtype=gs.dtype)
+            mati=opt_rep(opta.dagger,[engine.basis,basis],transpose=True,dtype=gs.dtype)
         else:
-            result.basis=BasisE((self.basis.nstate,self.basis.nparticle-1))
-        result.matrix=csr_matrix((result.basis.nbasis,result.basis.nbasis),dtype=complex128)
-        result.set_matrix()
-        return result
+            matj=opt_rep(opta,[engine.basis,basis],transpose=True,dtype=gs.dtype)
+            mati=opt_rep(optb,[engine.basis,basis],transpose=True,dtype=gs.dtype)
+        statei=mati.dot(gs)
+        statej=matj.dot(gs)
+        normj=norm(statej)
+        statej[:]=statej[:]/normj
+        lcz=Lanczos(matrix,statej)
+        overlaps=zeros(app.nstep,dtype=complex128)
+        for k in xrange(app.nstep):
+            if not lcz.cut:
+                overlaps[k]=vdot(statei,statej)*normj
+                lcz.iter()
+        return overlaps,array(lcz.a),array(lcz.b)
     else:
-        result=deepcopy(self)
-        if index.nambu==CREATION and index.spin==0:
-            result.basis=BasisE(up=(self.basis.nstate[0],self.basis.nparticle[0]),down=(self.basis.nstate[1],self.basis.nparticle[1]+1))
-        elif index.nambu==ANNIHILATION and index.spin==0:
-            result.basis=BasisE(up=(self.basis.nstate[0],self.basis.nparticle[0]),down=(self.basis.nstate[1],self.basis.nparticle[1]-1))
-        elif index.nambu==CREATION and index.spin==1:
-            result.basis=BasisE(up=(self.basis.nstate[0],self.basis.nparticle[0]+1),down=(self.basis.nstate[1],self.basis.nparticle[1]))
+        h,group=task
+        opts=[engine.operators['sp'][i] for i in group]
+        if h==0:
+            states=array([opt_rep(opt.dagger,[engine.basis,basis],transpose=True,dtype=gs.dtype).dot(gs) for opt in opts]).T
         else:
-            result.basis=BasisE(up=(self.basis.nstate[0],self.basis.nparticle[0]-1),down=(self.basis.nstate[1],self.basis.nparticle[1]))
-        result.matrix=csr_matrix((result.basis.nbasis,result.basis.nbasis),dtype=complex128)
-        result.set_matrix()
-        return result
+            states=array([opt_rep(opt,[engine.basis,basis],transpose=True,dtype=gs.dtype).dot(gs) for opt in opts]).T
+        lcz=BlockLanczos(matrix,states,dtype=states.dtype)
+        for k in xrange(app.nstep):
+            if lcz.cut: break
+            lcz.iter()
+        return lcz.r0,array(lcz.a),array(lcz.b)
+
+def onr_qmatrix(app):
+    '''
+    This function diagonalizes the block tridiagonal matrices stored in app.coeff once to get the Q-matrix form of the Green's function, i.e.
+        G(omega)=Q*(omega-poles)^(-1)*Q^dagger,
+    and sets app.Q and app.poles accordingly.
+    Poles with negligible weights, e.g. those from deflated directions, are discarded.
+    Parameters:
+        app: GFC
+            The app containing the block Lanczos coefficients.
+    '''
+    nmatrix,nopt=app.coeff.shape[2],app.coeff.shape[3]
+    Qs,poles=[],[]
+    for h in xrange(2):
+        nk=1
+        while nk<nmatrix and norm(app.coeff[h,2,nk-1])>RZERO: nk+=1
+        buff=zeros((nk*nopt,nk*nopt),dtype=complex128)
+        for k in xrange(nk):
+            buff[k*nopt:(k+1)*nopt,k*nopt:(k+1)*nopt]=app.coeff[h,1,k]
+            if k<nk-1:
+                buff[(k+1)*nopt:(k+2)*nopt,k*nopt:(k+1)*nopt]=app.coeff[h,2,k]
+                buff[k*nopt:(k+1)*nopt,(k+1)*nopt:(k+2)*nopt]=app.coeff[h,2,k].T.conjugate()
+        w,v=eigh(buff)
+        Q=dot(app.coeff[h,0,0].T.conjugate(),v[0:nopt,:])
+        Qs.append(Q if h==0 else Q.conjugate())
+        poles.append(w-app.gse if h==0 else app.gse-w)
+    Q,poles=hstack(Qs),concatenate(poles)
+    mask=norm(Q,axis=0)>RZERO
+    app.Q,app.poles=Q[:,mask],poles[mask]
+
+def onr_eh(engine,index,sectors):
+    '''
+    This function returns the basis and the Hamiltonian of the sector reached by acting the single particle operator specified by index on the ground state.
+    Parameters:
+        engine: ONR
+            The engine.
+        index: Index
+            The index of the single particle operator.
+        sectors: dict
+            The cache of the already constructed sectors, whose keys are nparticle for 'EP' bases, (nparticle_up,nparticle_down) for 'ES' bases and ('EG',parity) for fixed-parity 'EG' bases.
+            The bases and the matrices are shared among all the operators leading to the same sector, so each one is built at most once.
+    Returns:
+        basis: BasisE
+            The basis of the sector.
+        matrix: csr_matrix or LinearOperator
+            The Hamiltonian of the sector.
+    '''
+    delta=1 if index.nambu==CREATION else -1
+    if engine.basis.basis_type.lower()=='eg':
+        if engine.basis.parity is not None:
+            key=('EG',1-engine.basis.parity)
+        else:
+            return engine.basis,engine.matrix
+    elif engine.basis.basis_type.lower()=='ep':
+        key=int(engine.basis.nparticle)+delta
+    elif index.spin==0:
+        key=(int(engine.basis.nparticle[0]),int(engine.basis.nparticle[1])+delta)
+    else:
+        key=(int(engine.basis.nparticle[0])+delta,int(engine.basis.nparticle[1]))
+    if key not in sectors:
+        if engine.basis.basis_type.lower()=='eg':
+            basis=engine.basis if engine.basis.parity is None else BasisE(nstate=int(engine.basis.nstate),parity=1-engine.basis.parity)
+        elif engine.basis.basis_type.lower()=='ep':
+            basis=BasisE((int(engine.basis.nstate),key))
+        else:
+            basis=BasisE(up=(int(engine.basis.nstate[0]),key[0]),down=(int(engine.basis.nstate[1]),key[1]))
+        if engine.matrix_free:
+            sectors[key]=(basis,opts_linear_operator(engine.operators['h'],basis,dtype=opts_dtype(engine.operators['h'])))
+        else:
+            sectors[key]=(basis,opts_rep(engine.operators['h'],basis,dtype=opts_dtype(engine.operators['h'])))
+    return sectors[key]
 
 def ONRGF(engine,app):
+    '''
+    This function evaluates the single particle Green's function at app.omega from the Lanczos coefficients stored in engine.apps['GFC'].
+    When app.omega is an array of frequencies, all of them are evaluated at once and app.gf has the shape app.omega.shape+(nopt,nopt).
+    For the scalar method, each matrix element is a tridiagonal continued fraction evaluated by the backward recurrence:
+        S_k=1/(d_k-e_k^2*S_{k+1}), R_k=c_k-e_k*S_{k+1}*R_{k+1}, G=S_0*R_0,
+    with d_k=omega-(a[k]-gse)*(-1)^h, e_k=b[k]*(-1)^(h+1) and c_k the overlaps, while for the block method, the whole matrix is a block continued fraction:
+        S_k=(D_k-b[k]^dagger*S_{k+1}*b[k])^(-1),
+    with D_k=omega+gse-a[k] for the electron part and D_k=omega-gse+a[k] for the hole part, whose contributions are r0^dagger*S_0*r0 and its transpose respectively.
+    For the Q-matrix method, it is simply Q*(omega-poles)^(-1)*Q^dagger.
+    '''
     nmatrix=engine.apps['GFC'].nstep
     gse=engine.apps['GFC'].gse
     coeff=engine.apps['GFC'].coeff
     nopt=len(engine.operators['sp'])
-    app.gf[...]=0.0
-    buff=zeros((3,nmatrix),dtype=complex128)
-    b=zeros(nmatrix,dtype=complex128)
-    for i in xrange(nopt):
-        for j in xrange(nopt):
-            for h in xrange(2):
-                b[...]=0;b[0]=1
-                buff[0,1:]=coeff[i,j,h,2,0:nmatrix-1]*(-1)**(h+1)
-                buff[1,:]=app.omega-(coeff[i,j,h,1,:]-gse)*(-1)**h
-                buff[2,:]=coeff[i,j,h,2,:]*(-1)**(h+1)
-                app.gf[i,j]+=inner(coeff[i,j,h,0,:],solve_banded((1,1),buff,b,overwrite_ab=True,overwrite_b=True,check_finite=False))
+    omegas=asarray(app.omega).reshape(-1)
+    if engine.apps['GFC'].method=='Q':
+        Q,poles=engine.apps['GFC'].Q,engine.apps['GFC'].poles
+        result=einsum('im,wm,jm->wij',Q,1.0/(omegas[:,newaxis]-poles[newaxis,:]),Q.conjugate())
+    elif engine.apps['GFC'].method=='S':
+        sign=array([1,-1])
+        omega=omegas[:,newaxis,newaxis,newaxis]
+        for k in xrange(nmatrix-1,-1,-1):
+            d=omega-(coeff[:,:,:,1,k]-gse)*sign
+            if k<nmatrix-1:
+                e=-coeff[:,:,:,2,k]*sign
+                R=coeff[:,:,:,0,k]-e*S*R
+                S=1.0/(d-e**2*S)
+            else:
+                R=coeff[:,:,:,0,k]*ones_like(d)
+                S=1.0/d
+        result=(S*R).sum(axis=3)
+    else:
+        I=identity(nopt,dtype=complex128)
+        result=zeros((len(omegas),nopt,nopt),dtype=complex128)
+        for h in xrange(2):
+            for k in xrange(nmatrix-1,-1,-1):
+                D=omegas[:,newaxis,newaxis]*I-(coeff[h,1,k]-gse*I)*(-1)**h
+                if k<nmatrix-1: D-=einsum('ji,wjk,kl->wil',coeff[h,2,k].conjugate(),S,coeff[h,2,k])
+                S=inv(D)
+            buff=einsum('ji,wjk,kl->wil',coeff[h,0,0].conjugate(),S,coeff[h,0,0])
+            result+=buff if h==0 else buff.transpose((0,2,1))
+    shape=asarray(app.omega).shape+(nopt,nopt)
+    if app.gf.shape!=shape: app.gf=zeros(shape,dtype=complex128)
+    app.gf[...]=result.reshape(shape)
 
 def ONRDOS(engine,app):
     engine.cache.pop('gf_mesh',None)
@@ -233,8 +720,9 @@ def ONREB(engine,app):
         result[:,0]=array(xrange(app.path.rank.values()[0]))
     for i,paras in enumerate(app.path('+')):
         engine.update(**paras)
-        engine.set_matrix()
+        engine.set_matrix(cache=True)
         result[i,1:]=eigsh(engine.matrix,k=app.ns,which='SA',return_eigenvectors=False)
+    engine.cache.pop('matrix',None)
     if app.save_data:
         savetxt(engine.dout+'/'+engine.name.const+'_EB.dat',result)
     if app.plot:
@@ -2,7 +2,7 @@
 Simple self-consistent mean field theory.
 '''
 from TBAPy import *
-from scipy.optimize import broyden1,broyden2
+from Hamiltonian.Core.BasicAlgorithm.MixerPy import *
 class op:
     '''
     '''
@@ -43,20 +43,44 @@ class SCMF(TBA):
             self.ops[order.tag]=op(v,m)
 
     def update_ops(self,kspace=None):
+        '''
+        Update the order parameters from the mean field Hamiltonian with the current ones.
+        Each Hamiltonian on kspace is diagonalized exactly once. The eigenvalues determine the chemical potential, and per band only the density-matrix elements where the order parameters live are kept.
+        The k points are weighted by kspace.weight(), so that an irreducible BZ can be used for order parameters invariant under its point group.
+        '''
         self.generators['h'].update(**{key:self.ops[key].value for key in self.ops.keys()})
         self.name.update(alter=self.generators['h'].parameters['alter'])
-        self.set_mu(kspace)
-        f=(lambda e,mu: 1 if e<=mu else 0) if abs(self.temperature)<RZERO else (lambda e,mu: 1/(exp((e-mu)/self.temperature)+1))
         nmatrix=len(self.generators['h'].table)
         nspin=self.lattice.points.values()[0].struct.nspin
-        buff=zeros((nmatrix,nmatrix),dtype=complex128)
-        for matrix in self.matrices(kspace):
-            eigs,eigvecs=eigh(matrix)
-            for eig,eigvec in zip(eigs,eigvecs.T):
-                buff+=dot(eigvec.conj().reshape((nmatrix,1)),eigvec.reshape((1,nmatrix)))*f(eig,self.mu)
-        nstate=(1 if kspace is None else kspace.rank['k'])*nmatrix
+        rows,cols=nonzero(sum([abs(op.matrix) for op in self.ops.itervalues()],axis=0)>RZERO)
+        es,ds=[],[]
+        for e,v in self.eigs_batches(kspace):
+            es.append(e)
+            ds.append(v[:,rows,:].conj()*v[:,cols,:])
+        es,ds=concatenate(es),concatenate(ds)
+        self.set_mu(kspace,eigvals=es.ravel(),temperature=self.temperature)
+        weights=ones(es.shape[0]) if kspace is None else kspace.weight()
+        buff=einsum('kin,kn,k->i',ds,fermi_dirac(es,self.mu,self.temperature),weights)
+        nstate=weights.sum()*nmatrix
         for key in self.ops.keys():
-            self.ops[key].value=sum(buff*self.ops[key].matrix)/(nstate/nspin)
+            self.ops[key].value=sum(buff*self.ops[key].matrix[rows,cols])/(nstate/nspin)
+
+    def eigs_batches(self,kspace=None):
+        '''
+        This method returns a generator which iterates over the eigen decompositions of the Hamiltonians on kspace batch by batch.
+        Parameters:
+            kspace: BaseSpace, optional
+                The base space on which the Hamiltonians live.
+        Returns:
+            yield a 2-tuple (es,vs), the eigenvalues with shape (nk,n) and the eigenvectors with shape (nk,n,n) of a batch.
+        '''
+        if kspace is not None and kspace.mesh.keys()==['k']:
+            nchunk=self.nchunk(vectors=True)
+            for i in xrange(0,kspace.rank['k'],nchunk):
+                yield batch_eigh(self.matrix_mesh(kspace.mesh['k'][i:i+nchunk]))
+        else:
+            for matrix in self.matrices(kspace):
+                yield batch_eigh(matrix[newaxis,:,:])
 
     def iterate_sec(self,kspace=None,error=10**-4,n=200):
         stime=time.time()
@@ -83,15 +107,43 @@ class SCMF(TBA):
         etime=time.time()
         print 'Iterate: time consumed ',etime-stime,'s.'
 
-    def iterate(self,kspace=None,error=10**-6,n=200):
+    def iterate(self,kspace=None,error=10**-6,n=200,mixer=None):
+        '''
+        Iterate the order parameters until they are self-consistent.
+        Parameters:
+            kspace: BaseSpace, optional
+                The K-space on which the mean field Hamiltonian is defined.
+            error: float, optional
+                The tolerance, and the iteration stops as soon as the residual of every order parameter is below it.
+            n: integer, optional
+                The maximum number of iterations.
+            mixer: Mixer, optional
+                The mixer which proposes the next order parameters, AndersonMixer() when it is None.
+        Returns:
+            mixer: Mixer
+                The mixer used, whose attribute residuals records the residuals of every order parameter in every iteration.
+        '''
         stime=time.time()
-        def gx(values):
-            for op,value in zip(self.ops.values(),values):
-                op.value=value
+        mixer=AndersonMixer() if mixer is None else mixer
+        mixer.reset()
+        x=array([self.ops[key].value for key in self.ops.keys()])
+        for count in xrange(1,n+1):
             self.update_ops(kspace)
-            return array([self.ops[key].value for key in self.ops.keys()])-values
-        x0=array([self.ops[key].value for key in self.ops.keys()])
-        buff=broyden2(gx,x0,verbose=True,reduction_method='svd',maxiter=n,x_tol=error)
-        print 'Order parameters:',buff
+            r=array([self.ops[key].value for key in self.ops.keys()])-x
+            print 'Step,op,residual: ',count,',',x,abs(r)
+            if all(abs(r)<error):
+                x=x+r
+                break
+            x=mixer(x,r)
+            for op,value in zip(self.ops.values(),x):
+                op.value=value
+        else:
+            raise ValueError("SCMF iterate error: the iterations has exceeded the max step.")
+        for op,value in zip(self.ops.values(),x):
+            op.value=value
+        self.generators['h'].update(**{key:self.ops[key].value for key in self.ops.keys()})
+        self.name.update(alter=self.generators['h'].parameters['alter'])
+        print 'Order parameters:',x
         etime=time.time()
         print 'Iterate: time consumed ',etime-stime,'s.'
+        return mixer
@@ -5,8 +5,15 @@ from Hamiltonian.Core.BasicClass.AppPackPy import *
 from Hamiltonian.Core.BasicClass.QuadraticPy import *
 from Hamiltonian.Core.BasicClass.GeneratorPy import *
 from Hamiltonian.Core.BasicClass.NamePy import *
+from Hamiltonian.Core.BasicClass.BaseSpacePy import *
 from Hamiltonian.Core.BasicAlgorithm.BerryCurvaturePy import *
 from scipy.linalg import eigh
+from scipy.sparse import csr_matrix
+from scipy.optimize import brentq
+from numpy.linalg import eigvalsh
+from numpy.linalg import eigh as batch_eigh
+from multiprocessing import Pool,cpu_count
+from itertools import imap,izip
 import matplotlib.pyplot as plt 
 
 class TBA(Engine):
@@ -59,18 +66,52 @@ class TBA(Engine):
             result: 2D ndarray
                 The matrix representation of the Hamiltonian.
         '''
+        return self.matrix_mesh(None if len(k)==0 else [k],**karg)[0]
+
+    def matrix_mesh(self,kmesh=None,**karg):
+        '''
+        This method returns the matrix representations of the Hamiltonian on a batch of k points.
+        Parameters:
+            kmesh: 2D array-like, optional
+                The coords of the k points, one per row. When it is None, the Hamiltonian without any phase factor is returned as a batch of one.
+            karg: dict, optional
+                Other parameters.
+        Returns:
+            result: 3D ndarray
+                result[i,:,:] is the matrix representation of the Hamiltonian at kmesh[i].
+        Note: all the phase factors exp(-i*k*R) are computed as one matrix, and the operators are scattered into the batch by a single sparse product.
+        '''
         self.generators['h'].update(**karg)
         nmatrix=len(self.generators['h'].table)
-        result=zeros((nmatrix,nmatrix),dtype=complex128)
-        for opt in self.generators['h'].operators:
-            phase=1 if len(k)==0 else exp(-1j*inner(k,opt.rcoords[0]))
-            result[opt.seqs]+=opt.value*phase
-            if self.generators['h'].nambu:
-                i,j=opt.seqs
-                if i<nmatrix/2 and j<nmatrix/2: result[j+nmatrix/2,i+nmatrix/2]+=-opt.value*conjugate(phase)
-        result+=conjugate(result.T)
+        seqs,values,rcoords=self.generators['h'].packed()
+        phases=ones((1,len(values)),dtype=complex128) if kmesh is None else exp(-1j*dot(asarray(kmesh,dtype=float64).reshape((-1,rcoords.shape[1])),rcoords.T))
+        buff,rows,cols=[phases*values],[seqs[:,0]],[seqs[:,1]]
+        if self.generators['h'].nambu:
+            mask=(seqs[:,0]<nmatrix/2)&(seqs[:,1]<nmatrix/2)
+            buff.append(-conjugate(phases[:,mask])*values[mask])
+            rows.append(seqs[mask,1]+nmatrix/2)
+            cols.append(seqs[mask,0]+nmatrix/2)
+        buff,rows,cols=concatenate(buff,axis=1),concatenate(rows),concatenate(cols)
+        scatter=csr_matrix((ones(len(rows)),(rows*nmatrix+cols,arange(len(rows)))),shape=(nmatrix**2,len(rows)))
+        result=scatter.dot(buff.T).T.reshape((buff.shape[0],nmatrix,nmatrix))
+        result+=conjugate(transpose(result,axes=(0,2,1)))
         return result
 
+    def nchunk(self,vectors=False,memory=None):
+        '''
+        This method returns the number of k points whose Hamiltonians are built and diagonalized together in one batch.
+        Parameters:
+            vectors: logical, optional
+                A flag to tag whether the eigenvectors are also needed.
+            memory: integer, optional
+                The memory budget in bytes of one batch. When it is None, TBA_MEMORY is used.
+        Returns:
+            result: integer
+                The number of k points in one batch.
+        '''
+        nmatrix=len(self.generators['h'].table)
+        return max(1,int((TBA_MEMORY if memory is None else memory)/(16*nmatrix**2*(2 if vectors else 1))))
+
     def matrices(self,basespace=None,mode='*'):
         '''
         This method returns a generator which iterates over all the Hamiltonians living on the input basespace.
@@ -81,36 +122,171 @@ class TBA(Engine):
                 The mode which the generators takes to iterate over the base space.
         Returns:
             yield a 2D ndarray.
+        Note: when the base space is a pure K-space, the Hamiltonians are built in batches whose sizes are determined by self.nchunk().
         '''
         if basespace is None:
             yield self.matrix()
+        elif basespace.mesh.keys()==['k']:
+            nchunk=self.nchunk()
+            for i in xrange(0,basespace.rank['k'],nchunk):
+                for matrix in self.matrix_mesh(basespace.mesh['k'][i:i+nchunk]):
+                    yield matrix
         else:
             for paras in basespace(mode):
                 yield self.matrix(**paras)
 
-    def eigvals(self,basespace=None):
+    def eigs(self,kmesh,vectors=False,memory=None,parallel=False,np=0):
+        '''
+        This method returns the eigenvalues, and optionally the eigenvectors, of the Hamiltonians on a mesh of k points.
+        The Hamiltonians are built and diagonalized in batches sized to the memory budget, and the results are streamed into preallocated arrays.
+        Parameters:
+            kmesh: 2D array-like or LazyMesh
+                The coords of the k points, one per row. A LazyMesh is generated batch by batch without being materialized.
+            vectors: logical, optional
+                A flag to tag whether the eigenvectors are also returned.
+            memory: integer, optional
+                The memory budget in bytes of one batch. When it is None, TBA_MEMORY is used.
+            parallel: logical, optional
+                A flag to tag whether the batches are distributed over a process pool.
+            np: integer, optional
+                The number of processes in the pool, 0 for all the available cpus.
+        Returns:
+            es: 2D ndarray
+                es[i,:] are the eigenvalues at kmesh[i] in the ascending order.
+            vs: 3D ndarray, only returned when vectors is True
+                vs[i,:,n] is the eigenvector of es[i,n].
+        '''
+        if not isinstance(kmesh,LazyMesh): kmesh=asarray(kmesh,dtype=float64)
+        nk,nmatrix=len(kmesh),len(self.generators['h'].table)
+        nchunk=self.nchunk(vectors=vectors,memory=memory)
+        chunks=[(i,min(i+nchunk,nk)) for i in xrange(0,nk,nchunk)]
+        es=zeros((nk,nmatrix))
+        if vectors: vs=zeros((nk,nmatrix,nmatrix),dtype=complex128)
+        TBA_EIGS_SHARED.update(engine=self,kmesh=kmesh,vectors=vectors)
+        if parallel and len(chunks)>1:
+            pool=Pool(processes=np if np>0 else cpu_count())
+            results=pool.imap(tba_eigs_chunk,chunks)
+        else:
+            pool=None
+            results=imap(tba_eigs_chunk,chunks)
+        for (start,stop),result in izip(chunks,results):
+            if vectors:
+                es[start:stop],vs[start:stop]=result
+            else:
+                es[start:stop]=result
+        if pool is not None:
+            pool.close()
+            pool.join()
+        TBA_EIGS_SHARED.clear()
+        return (es,vs) if vectors else es
+
+    def eigvals(self,basespace=None,parallel=False,np=0):
         '''
         This method returns all the eigenvalues of the Hamiltonian.
         Parameters:
             basespace: BaseSpace, optional
                 The base space on which the Hamiltonian is defined.
+            parallel: logical, optional
+                A flag to tag whether a pure K-space is diagonalized over a process pool.
+            np: integer, optional
+                The number of processes in the pool, 0 for all the available cpus.
         Returns:
             result: 1D ndarray
                 All the eigenvalues.
         '''
+        if basespace is not None and basespace.mesh.keys()==['k']:
+            return self.eigs(basespace.mesh['k'],parallel=parallel,np=np).ravel()
         nmatrix=len(self.generators['h'].table)
         result=zeros(nmatrix*(1 if basespace==None else product(basespace.rank.values())))
-        if basespace is None:
-            result[...]=eigh(self.matrix(),eigvals_only=True)
-        else:
-            for i,paras in enumerate(basespace('*')):
-                result[i*nmatrix:(i+1)*nmatrix]=eigh(self.matrix(**paras),eigvals_only=True)
+        for i,matrix in enumerate(self.matrices(basespace)):
+            result[i*nmatrix:(i+1)*nmatrix]=eigh(matrix,eigvals_only=True)
         return result
 
-    def set_mu(self,kspace=None):
-        nelectron=int(round(self.filling*(1 if kspace is None else kspace.rank['k'])*len(self.generators['h'].table)))
-        eigvals=sort((self.eigvals(kspace)))
-        self.mu=(eigvals[nelectron]+eigvals[nelectron-2])/2
+    def set_mu(self,kspace=None,eigvals=None,temperature=0.0):
+        '''
+        Set the chemical potential according to the filling.
+        Parameters:
+            kspace: BaseSpace, optional
+                The K-space on which the Hamiltonian is defined.
+            eigvals: 1D ndarray, optional
+                The eigenvalues of the Hamiltonian on kspace, which are computed when it is None.
+            temperature: float, optional
+                The temperature.
+        '''
+        nmatrix=len(self.generators['h'].table)
+        weights=None if kspace is None else repeat(kspace.weight(),nmatrix)
+        nelectron=int(round(self.filling*(1 if kspace is None else kspace.weight('k').sum())*nmatrix))
+        self.mu=tba_mu(self.eigvals(kspace) if eigvals is None else eigvals,nelectron,temperature,weights)
+
+def fermi_dirac(es,mu,temperature):
+    '''
+    This function returns the Fermi-Dirac occupations of the energy levels.
+    Parameters:
+        es: ndarray
+            The energy levels.
+        mu: float
+            The chemical potential.
+        temperature: float
+            The temperature, and the step function is used when it is zero.
+    Returns:
+        result: ndarray
+            The occupations with the same shape as es.
+    '''
+    if abs(temperature)<RZERO:
+        return (es<=mu).astype(float64)
+    else:
+        return 0.5*(1-tanh((es-mu)/(2*temperature)))
+
+def tba_mu(eigvals,nelectron,temperature=0.0,weights=None):
+    '''
+    This function returns the chemical potential with nelectron electrons filling the energy levels.
+    Parameters:
+        eigvals: 1D ndarray
+            The energy levels.
+        nelectron: integer
+            The number of electrons.
+        temperature: float, optional
+            The temperature.
+        weights: 1D ndarray of integers, optional
+            The degeneracies of the energy levels, e.g. the weights of the k points of an irreducible BZ repeated for each band.
+            All the levels are nondegenerate when it is None.
+    Returns:
+        result: float
+            The chemical potential.
+    Note: at zero temperature, it is (e[nelectron]+e[nelectron-2])/2 with e the sorted levels counted with their degeneracies.
+    When weights is None, only these two order statistics are selected without a full sort, otherwise the levels are fully sorted once and the two are located in the cumulative sum of the weights.
+    At finite temperature, it is the root of sum(fermi_dirac(eigvals,mu,temperature))==nelectron found by bisection.
+    '''
+    eigvals=asarray(eigvals).ravel()
+    if abs(temperature)<RZERO:
+        if weights is None:
+            buff=partition(eigvals,[nelectron-2,nelectron])
+            return (buff[nelectron]+buff[nelectron-2])/2
+        else:
+            indices=argsort(eigvals)
+            buff=eigvals[indices][searchsorted(cumsum(asarray(weights)[indices]),[nelectron-2,nelectron],side='right')]
+            return (buff[1]+buff[0])/2
+    else:
+        weights=1 if weights is None else asarray(weights)
+        f=lambda mu: sum(weights*fermi_dirac(eigvals,mu,temperature))-nelectron
+        return brentq(f,eigvals.min()-50*abs(temperature),eigvals.max()+50*abs(temperature))
+
+TBA_MEMORY=2**28
+TBA_EIGS_SHARED={}
+
+def tba_eigs_chunk(chunk):
+    '''
+    This function diagonalizes the Hamiltonians of a batch of k points.
+    Parameters:
+        chunk: 2-tuple
+            The start and the stop of the batch in TBA_EIGS_SHARED['kmesh'].
+    Returns:
+        The eigenvalues, or the eigenvalues and the eigenvectors when TBA_EIGS_SHARED['vectors'] is True.
+    Note: TBA_EIGS_SHARED is filled before the process pool is forked, so that the workers share the engine and the mesh without any pickling.
+    '''
+    engine,kmesh,vectors=TBA_EIGS_SHARED['engine'],TBA_EIGS_SHARED['kmesh'],TBA_EIGS_SHARED['vectors']
+    matrices=engine.matrix_mesh(kmesh[chunk[0]:chunk[1]])
+    return batch_eigh(matrices) if vectors else eigvalsh(matrices)
 
 def TBAEB(engine,app):
     nmatrix=len(engine.generators['h'].table)
@@ -121,8 +297,11 @@ def TBAEB(engine,app):
             result[:,0]=app.path.mesh[key]
         else:
             result[:,0]=array(xrange(app.path.rank[key]))
-        for i,parameter in enumerate(list(app.path.mesh[key])):
-            result[i,1:]=eigh(engine.matrix(**{key:parameter}),eigvals_only=True)
+        if key=='k':
+            result[:,1:]=engine.eigs(app.path.mesh[key],parallel=app.parallel,np=app.np)
+        else:
+            for i,parameter in enumerate(list(app.path.mesh[key])):
+                result[i,1:]=eigh(engine.matrix(**{key:parameter}),eigvals_only=True)
     else:
         result=zeros((2,nmatrix+1))
         result[:,0]=array(xrange(2))
@@ -141,10 +320,11 @@ def TBAEB(engine,app):
 
 def TBADOS(engine,app):
     result=zeros((app.ne,2))
-    eigvals=engine.eigvals(app.BZ)
+    eigvals=engine.eigvals(app.BZ,parallel=app.parallel,np=app.np)
+    weights=1 if app.BZ is None else repeat(app.BZ.weight(),len(engine.generators['h'].table))
     for i,v in enumerate(linspace(eigvals.min(),eigvals.max(),num=app.ne)):
        result[i,0]=v
-       result[i,1]=sum(app.eta/((v-eigvals)**2+app.eta**2))
+       result[i,1]=sum(weights*app.eta/((v-eigvals)**2+app.eta**2))
     if app.save_data:
         savetxt(engine.dout+'/'+engine.name.full+'_DOS.dat',result)
     if app.plot:
@@ -157,17 +337,21 @@ def TBADOS(engine,app):
         plt.close()
 
 def TBACP(engine,app):
-    nelectron=int(round(engine.filling*app.BZ.rank['k']*len(engine.generators['h'].table)))
-    eigvals=sort((engine.eigvals(app.BZ)))
-    app.mu=(eigvals[nelectron]+eigvals[nelectron-2])/2
+    nmatrix=len(engine.generators['h'].table)
+    nelectron=int(round(engine.filling*app.BZ.weight('k').sum()*nmatrix))
+    app.mu=tba_mu(engine.eigvals(app.BZ,parallel=app.parallel,np=app.np),nelectron,weights=repeat(app.BZ.weight(),nmatrix))
     engine.mu=app.mu
     print 'mu:',app.mu
 
 def TBACN(engine,app):
-    H=lambda kx,ky: engine.matrix(k=[kx,ky])
     app.bc=zeros(app.BZ.rank['k'])
-    for i,paras in enumerate(app.BZ()):
-        app.bc[i]=berry_curvature(H,paras['k'][0],paras['k'][1],engine.mu,d=app.d)
+    dx,dy=array([app.d,0.0]),array([0.0,app.d])
+    nchunk=max(1,engine.nchunk()/5)
+    for i in xrange(0,app.BZ.rank['k'],nchunk):
+        ks=app.BZ.mesh['k'][i:i+nchunk]
+        Hs=engine.matrix_mesh(concatenate([ks,ks+dx,ks-dx,ks+dy,ks-dy])).reshape((5,len(ks))+(len(engine.generators['h'].table),)*2)
+        for j in xrange(len(ks)):
+            app.bc[i+j]=berry_curvature_kubo(Hs[0,j],(Hs[1,j]-Hs[2,j])/(2*app.d),(Hs[3,j]-Hs[4,j])/(2*app.d),engine.mu)
     print 'Chern number(mu):',app.cn,'(',engine.mu,')'
     if app.save_data or app.plot:
         buff=zeros((app.BZ.rank['k'],3))
@@ -86,13 +86,24 @@ class VCACCT(VCA):
         buff=[]
         for group in self.groups.itervalues():
             buff.extend([self.subsystems[group[0]].gf(omega)]*len(group))
-        return block_diag(*buff)
+        if buff[0].ndim==2:
+            return block_diag(*buff)
+        else:
+            return array([block_diag(*[gf[i] for gf in buff]) for i in xrange(buff[0].shape[0])])
 
 def VCACCTGFC(engine,app):
-    buff=deepcopy(app)
-    buff.run=ONRGFC
+    '''
+    This function calculates the Lanczos coefficients of the single particle Green's functions of the subsystems, one for each group.
+    The ground state energy of the whole cluster is summed over the subsystems, and for the method 'Q', the Q-matrices of the subsystems are assembled block-diagonally and their poles concatenated in the same order as the blocks of VCACCT.gf.
+    '''
+    app.gse,Qs,poles=0,[],[]
     for group in engine.groups.itervalues():
-        for i,name in enumerate(group):
-            if i==0:
-                engine.subsystems[name].addapps('GFC',buff)
-                engine.subsystems[name].runapps('GFC')
+        buff=deepcopy(app)
+        buff.run=ONRGFC
+        engine.subsystems[group[0]].addapps('GFC',buff)
+        engine.subsystems[group[0]].runapps('GFC')
+        app.gse+=buff.gse*len(group)
+        Qs.extend([buff.Q]*len(group))
+        poles.extend([buff.poles]*len(group))
+    if app.method=='Q':
+        app.Q,app.poles=block_diag(*Qs),concatenate(poles)
@@ -2,7 +2,7 @@ from ONRPy import *
 from VCA_Fortran import *
 from Hamiltonian.Core.BasicAlgorithm.IntegrationPy import *
 from Hamiltonian.Core.BasicAlgorithm.BerryCurvaturePy import *
-from numpy.linalg import det,inv
+from numpy.linalg import det,inv,eigvalsh
 from scipy import interpolate
 from scipy.integrate import quad
 from scipy.optimize import newton,brenth,brentq
@@ -31,10 +31,15 @@ class VCA(ONR):
     13) clmap: a dict containing the information needed to restore the translation symmetry broken by the choosing of the clusters, which has two entries:
         (1) 'seqs': a two dimensinal array whose element[i,j] represents the index sequence of the j-th single-particle operator within the cluster which should correspond to the i-th single-particle operator within the unit cell after the restoration of the translation symmetry;
         (2) 'coords': a three dimensinal array whose element[i,j,:] represents the rcoords of the j-th single-particle operator within the cluster which should correspond to the i-th single-particle operator within the unit cell after the restoration of the translation symmetry;
-    14) matrix: the sparse matrix representation of the system;
-    15) cache: the cache during the process of calculation.
+    14) matrix: the sparse matrix representation of the system, which is a LinearOperator in the matrix-free mode;
+    15) matrix_free: a flag to tag whether the Hamiltonian is applied on the fly instead of being stored as a sparse matrix;
+    16) symmetry: always False, since the cluster Hamiltonian only contains the intra-cluster bonds and is never translation invariant;
+    17) spinflip: the parity of the ground state under the spin flip, 1 or -1, 'auto' to find it automatically, or None if the spin-flip symmetry is not used;
+    18) particlehole: the parity of the ground state under the particle-hole transformation, 1 or -1, 'auto' to find it automatically, or None if the particle-hole symmetry is not used;
+    19) sector: the symmetry-adapted basis of the ground state sector, which is None when no symmetry is used;
+    20) cache: the cache during the process of calculation.
     '''
-    def __init__(self,ensemble='c',filling=0.5,mu=0,basis=None,nspin=1,cell=None,lattice=None,terms=None,weiss=None,nambu=False,**karg):
+    def __init__(self,ensemble='c',filling=0.5,mu=0,basis=None,nspin=1,cell=None,lattice=None,terms=None,weiss=None,nambu=False,matrix_free=False,spinflip=None,particlehole=None,**karg):
         self.ensemble=ensemble
         self.filling=filling
         self.mu=mu
@@ -49,6 +54,11 @@ class VCA(ONR):
         self.terms=terms
         self.weiss=weiss
         self.nambu=nambu
+        self.matrix_free=matrix_free
+        self.symmetry=False
+        self.spinflip=spinflip
+        self.particlehole=particlehole
+        self.sector=None
         self.generators={}
         self.generators['h']=Generator(
                     bonds=      [bond for bond in lattice.bonds if bond.is_intra_cell()],
@@ -166,12 +176,20 @@ class VCA(ONR):
         ngf,ngf_vca,gf=len(self.operators['sp']),len(self.operators['csp']),self.gf(omega)
         return gf_contract(k=k,gf_buff=dot(gf,inv(identity(ngf,dtype=complex128)-dot(self.pt(k),gf))),seqs=self.clmap['seqs'],coords=self.clmap['coords'])/(ngf/ngf_vca)
 
-    def gf_vca_kmesh(self,omega,kmesh):
+    def gf_vca_kmesh(self,omega,kmesh,gf=None):
         '''
         Returns the mesh of the single particle Green's functions of the system.
+        Parameters:
+            omega: number
+                The frequency.
+            kmesh: 2D ndarray
+                The mesh of k points.
+            gf: 2D ndarray, optional
+                The cluster Green's function at omega, e.g. one slice of a batch evaluated by self.gf over an array of frequencies.
+                When it is None, it will be evaluated on the spot.
         '''
         ngf,ngf_vca=len(self.operators['sp']),len(self.operators['csp'])
-        gf=self.gf(omega)
+        if gf is None: gf=self.gf(omega)
         buff=einsum('jk,ikl->ijl',gf,inv(identity(ngf,dtype=complex128)-dot(self.pt_mesh(kmesh),gf)))
         result=zeros((kmesh.shape[0],ngf_vca,ngf_vca),dtype=complex128)
         for n,k in enumerate(kmesh):
@@ -212,8 +230,9 @@ def VCAEB(engine,app):
     engine.cache.pop('pt_mesh',None)
     erange=linspace(app.emin,app.emax,app.ne)
     result=zeros((app.path.rank['k'],app.ne))
+    gfs=copy(engine.gf(erange+engine.mu+app.eta*1j))
     for i,omega in enumerate(erange):
-        result[:,i]=-2*imag((trace(engine.gf_vca_kmesh(omega+engine.mu+app.eta*1j,app.path.mesh['k']),axis1=1,axis2=2)))
+        result[:,i]=-2*imag((trace(engine.gf_vca_kmesh(omega+engine.mu+app.eta*1j,app.path.mesh['k'],gf=gfs[i]),axis1=1,axis2=2)))
     if app.save_data:
         buff=zeros((app.path.rank['k']*app.ne,3))
         for k in xrange(buff.shape[0]):
@@ -234,8 +253,9 @@ def VCAEB(engine,app):
 
 def VCACP(engine,app):
     engine.cache.pop('pt_mesh',None)
-    nelectron=app.BZ.rank['k']*len(engine.operators['csp'])*engine.filling
-    fx=lambda omega: -sum(imag((trace(engine.gf_vca_kmesh(omega+app.eta*1j,app.BZ.mesh['k']),axis1=1,axis2=2))))/pi
+    weights=app.BZ.weight('k')
+    nelectron=weights.sum()*len(engine.operators['csp'])*engine.filling
+    fx=lambda omega: -sum(weights*imag((trace(engine.gf_vca_kmesh(omega+app.eta*1j,app.BZ.mesh['k']),axis1=1,axis2=2))))/pi
     for i,(a,b,deg) in enumerate(app.e_degs):
         buff=0
         if i<2:
@@ -267,9 +287,11 @@ def VCADOS(engine,app):
     engine.cache.pop('pt_mesh',None)
     erange=linspace(app.emin,app.emax,app.ne)
     result=zeros((app.ne,2))
+    weights=app.BZ.weight('k')
+    gfs=copy(engine.gf(erange+engine.mu+app.eta*1j))
     for i,omega in enumerate(erange):
         result[i,0]=omega
-        result[i,1]=-2*imag(sum((trace(engine.gf_vca_kmesh(omega+engine.mu+app.eta*1j,app.BZ.mesh['k']),axis1=1,axis2=2))))
+        result[i,1]=-2*imag(sum(weights*(trace(engine.gf_vca_kmesh(omega+engine.mu+app.eta*1j,app.BZ.mesh['k'],gf=gfs[i]),axis1=1,axis2=2))))
     if app.save_data:
         savetxt(engine.dout+'/'+engine.name.full+'_DOS.dat',result)
     if app.plot:
@@ -284,11 +306,20 @@ def VCADOS(engine,app):
 def VCAGP(engine,app):
     engine.cache.pop('pt_mesh',None)
     ngf=len(engine.operators['sp'])
+    weights=app.BZ.weight('k')
     app.gp=0
-    fx=lambda omega: sum(log(abs(det(eye(ngf)-dot(engine.pt_mesh(app.BZ.mesh['k']),engine.gf(omega=omega*1j+engine.mu))))))
-    app.gp=quad(fx,0,float(inf))[0]
-    app.gp=(engine.apps['GFC'].gse-2/engine.nspin*app.gp/(pi*app.BZ.rank['k']))/engine.clmap['seqs'].shape[1]
-    app.gp=app.gp+real(sum(trace(engine.pt_mesh(app.BZ.mesh['k']),axis1=1,axis2=2))/app.BZ.rank['k']/engine.clmap['seqs'].shape[1])
+    if engine.apps['GFC'].method=='Q' and getattr(engine.apps['GFC'],'Q',array([])).size>0:
+        Q,poles=engine.apps['GFC'].Q,engine.apps['GFC'].poles
+        for weight,pt in zip(weights,engine.pt_mesh(app.BZ.mesh['k'])):
+            buff=dot(Q.T.conjugate(),dot(pt,Q))
+            buff[diag_indices_from(buff)]+=poles
+            app.gp+=weight*(sum(abs(eigvalsh(buff)-engine.mu))-sum(abs(poles-engine.mu)))
+        app.gp=app.gp*pi/2
+    else:
+        fx=lambda omega: sum(weights*log(abs(det(eye(ngf)-dot(engine.pt_mesh(app.BZ.mesh['k']),engine.gf(omega=omega*1j+engine.mu))))))
+        app.gp=quad(fx,0,float(inf))[0]
+    app.gp=(engine.apps['GFC'].gse-2/engine.nspin*app.gp/(pi*weights.sum()))/engine.clmap['seqs'].shape[1]
+    app.gp=app.gp+real(sum(weights*trace(engine.pt_mesh(app.BZ.mesh['k']),axis1=1,axis2=2))/weights.sum()/engine.clmap['seqs'].shape[1])
     app.gp=app.gp-engine.mu*engine.filling*len(engine.operators['csp'])*2/engine.nspin
     app.gp=app.gp/len(engine.cell.points)
     print 'gp:',app.gp
@@ -1,8 +1,12 @@
 from Hamiltonian.Core.BasicClass.BaseSpacePy import *
+from Hamiltonian.Core.BasicClass.LatticePy import *
+import time
 def test_basespace():
     test_kspace()
     test_kspace_functions()
     test_basespace_call()
+    test_irreducible_bz()
+    test_lazy_mesh()
 
 def test_kspace():
     a=KSpace(reciprocals=[array([2*pi,0.0]),array([0.0,2*pi])],nk=100)
@@ -20,7 +24,7 @@ def test_kspace_functions():
     a=rectangle_bz(nk=100)
     a.plot(show=True)
     print a.volume['k']/(2*pi)**2
-    a=hexagon_bz(nk=100,vh='v')
+    a=hexagon_bz(nk=99,vh='v')
     a.plot(show=True)
     print a.volume['k']/(2*pi)**2
     a=hexagon_gkm(nk=100)
@@ -32,3 +36,34 @@ def test_basespace_call():
         print i,paras
     for i,paras in enumerate(a('+')):
         print i,paras
+
+def test_irreducible_bz():
+    p1=Point(site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(norbital=1,nspin=1,nnambu=1))
+    a=Lattice('S',[p1],vectors=[array([1.0,0.0]),array([0.0,1.0])])
+    ops=a.point_group()
+    b=irreducible_bz(square_bz(nk=100),a.reciprocals,ops)
+    print len(ops),b.rank['k'],b.weight('k').sum()
+    b.plot(show=True)
+    p2=Point(site=1,rcoord=[0.0,sqrt(3.0)/3],icoord=[0.0,0.0],struct=Fermi(norbital=1,nspin=1,nnambu=1))
+    a=Lattice('H',[p1,p2],vectors=[array([1.0,0.0]),array([0.5,sqrt(3.0)/2])])
+    ops=a.point_group()
+    b=irreducible_bz(hexagon_bz(reciprocals=a.reciprocals,nk=99),a.reciprocals,ops)
+    print len(ops),b.rank['k'],b.weight('k').sum()
+    b.plot(show=True)
+    try:
+        hexagon_bz(reciprocals=a.reciprocals,nk=100)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Test_irreducible_bz error: hexagon_bz accepts an nk not divisible by 3.")
+
+def test_lazy_mesh():
+    stime=time.time()
+    a=hexagon_bz(nk=999)
+    etime=time.time()
+    print 'hexagon_bz(nk=999): time consumed ',etime-stime,'s.'
+    b=hexagon_bz(nk=999,nchunk=10**5)
+    print b.rank['k'],norm(a.mesh['k']-concatenate(list(b.mesh['k'].chunks()))),norm(a.mesh['k'][12345]-b.mesh['k'][12345])
+    a=KSpace(reciprocals=[array([1.0,0.0,0.0]),array([0.0,1.0,0.0]),array([0.0,0.0,1.0])],nk=50)
+    b=KSpace(reciprocals=[array([1.0,0.0,0.0]),array([0.0,1.0,0.0]),array([0.0,0.0,1.0])],nk=50,nchunk=1000)
+    print b.rank['k'],norm(a.mesh['k']-asarray(b.mesh['k'])),norm(a.mesh['k'][100:2100]-b.mesh['k'][100:2100])
@@ -6,9 +6,56 @@ def test_basise():
     a=BasisE(up=(m,n),down=(m,n))
     for i in xrange(nloop):
         test_while1(a.nbasis,a.basis_table)
-#        test_while2(a.nbasis,a.basis_table)
+#        test_while2(a.nbasis,a.basis_table,a.rank_info)
     etime=time.time()
     print etime-stime
+    test_rank(a)
+    test_symmetric()
+    test_parity()
+
+def test_rank(a):
+    stime=time.time()
+    for i in xrange(a.nbasis):
+        if seq_basis_rank(a.basis_table[i],a.basis_table,a.rank_table,a.rank_info)!=i:
+            raise ValueError("Test_rank error: the rank of the %s-th basis is wrong."%i)
+    etime=time.time()
+    print etime-stime
+
+def test_symmetric():
+    m=6;n=3
+    a=BasisE((m,n))
+    perms=array([roll(arange(m),g) for g in xrange(m)])
+    nbasis=0
+    for k in xrange(m):
+        b=SymmetricBasisE(a,perms,exp(-2j*pi*k*arange(m)/m))
+        print b
+        nbasis+=b.nbasis
+    if nbasis!=a.nbasis:
+        raise ValueError("Test_symmetric error: the sectors do not add up to the whole basis.")
+    a=BasisE(up=(4,2),down=(4,2))
+    sf=(arange(8)+4)%8
+    eta=array([1,-1,1,-1,1,-1,1,-1])
+    perms=array([arange(8),arange(8),sf,sf])
+    holes=array([zeros(8),eta,zeros(8),eta])
+    nbasis=0
+    for pf in (1,-1):
+        for ph in (1,-1):
+            b=SymmetricBasisE(a,perms,array([1,ph,pf,pf*ph]),holes)
+            print pf,ph,b.nbasis
+            nbasis+=b.nbasis
+    if nbasis!=a.nbasis:
+        raise ValueError("Test_symmetric error: the spin-flip and particle-hole sectors do not add up to the whole basis.")
+
+def test_parity():
+    a=BasisE(nstate=6)
+    for parity in (0,1):
+        b=BasisE(nstate=6,parity=parity)
+        for i in xrange(b.nbasis):
+            rep=basis_rep(i,b.basis_table,b.rank_info)
+            if bin(rep).count('1')%2!=parity or seq_basis_rank(rep,b.basis_table,b.rank_table,b.rank_info)!=i:
+                raise ValueError("Test_parity error: the %s-th basis of parity %s is wrong."%(i,parity))
+        if 2*b.nbasis!=a.nbasis:
+            raise ValueError("Test_parity error: the parity sectors do not add up to the whole basis.")
 
 @jit
 def test_while1(nbasis,basis_table):
@@ -31,8 +78,8 @@ def test_while1(nbasis,basis_table):
                 result=(lb+ub)/2
 
 @jit
-def test_while2(nbasis,basis_table):
+def test_while2(nbasis,basis_table,rank_info):
     ntable=len(basis_table)
     for i in xrange(nbasis):
-        rep=basis_rep(i,basis_table)
+        rep=basis_rep(i,basis_table,rank_info)
         seq=seq_basis(rep,basis_table)
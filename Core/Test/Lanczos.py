@@ -5,3 +5,9 @@ def test_lanczos():
     print a.matrix.todense()
     print a.eig(job='v')
     print eigsh(a.matrix,which='SA',k=1)
+    b=BlockLanczos(a.matrix,identity(4)[:,0:2])
+    while not b.cut: b.iter()
+    print b.r0
+    print b.a
+    print b.b
+    print trlanczos(a.matrix,k=1,nkrylov=3)
@@ -0,0 +1,12 @@
+from Hamiltonian.Core.BasicAlgorithm.MixerPy import *
+def test_mixer():
+    a=array([[0.6,0.3,0.0],[0.2,0.5,0.2],[0.0,0.3,0.7]])
+    b=array([1.0,-1.0,0.5])
+    F=lambda x: dot(a,x)+0.1*sin(x)+b
+    for mixer in (Mixer(),AndersonMixer(),BroydenMixer()):
+        x=zeros(3)
+        for count in xrange(1,201):
+            r=F(x)-x
+            if max(abs(r))<10**-10: break
+            x=mixer(x,r)
+        print mixer.__class__.__name__,count,x,norm(F(x)-x)
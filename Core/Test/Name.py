@@ -4,3 +4,4 @@ def test_name():
     a.update({0:1.0})
     a.update({1:2.0+2.0j})
     print a
+    print a.digest
@@ -1,7 +1,16 @@
 from Hamiltonian.Core.CoreAlgorithm.ONRPy import *
 from Hamiltonian.Core.BasicClass.LatticePy import *
 from Hamiltonian.Core.BasicClass.BaseSpacePy import *
+import tempfile,shutil
 def test_onr():
+    test_onr_body()
+    test_onr_gfc_store()
+    test_onr_matrix_cache()
+    test_onr_sectors()
+    test_onr_gfc_methods()
+    test_onr_gf_batch()
+
+def test_onr_body():
     U=0.0
     t=-1.0
     m=2;n=2
@@ -16,12 +25,201 @@ def test_onr():
             basis=      BasisE(up=(m*n,m*n/2),down=(m*n,m*n/2)),
             #basis=      BasisE((2*m*n,m*n)),
             nspin=      2,
+            matrix_free=False,
             lattice=    Lattice(name='WG'+str(m)+str(n),points=[p1],translations=[(a1,m),(a2,n)]),
             terms=[     Hopping('t',t,neighbour=1),
                         Hubbard('U',U,modulate=lambda **karg:karg['U'])
                         ]
         )
-    a.addapps('GFC',GFC(nstep=200,save_data=False,vtype='RD',run=ONRGFC))
+    a.addapps('GFC',GFC(nstep=200,save_data=False,vtype='RD',method='S',run=ONRGFC))
     a.addapps('DOS',DOS(emin=-5,emax=5,ne=401,eta=0.05,save_data=False,run=ONRDOS,show=True))
     #a.addapps('EB',EB(path=BaseSpace({'tag':'U','mesh':linspace(0.0,5.0,100)}),ns=6,save_data=False,run=ONREB))
     a.runapps()
+
+def test_onr_gfc_store():
+    U=4.0
+    t=-1.0
+    m=2;n=2
+    din=tempfile.mkdtemp()
+    try:
+        p1=Point(scope='WG'+str(m)+str(n),site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(atom=0,norbital=1,nspin=2,nnambu=1))
+        a1=array([1.0,0.0])
+        a2=array([0.0,1.0])
+        a=ONR(
+                din=        din,
+                name=       'WG'+str(m)+str(n),
+                ensemble=   'c',
+                filling=    0.5,
+                mu=         U/2,
+                basis=      BasisE(up=(m*n,m*n/2),down=(m*n,m*n/2)),
+                nspin=      2,
+                lattice=    Lattice(name='WG'+str(m)+str(n),points=[p1],translations=[(a1,m),(a2,n)]),
+                terms=[     Hopping('t',t,neighbour=1),
+                            Hubbard('U',U)
+                            ]
+            )
+        a.addapps(app=GFC(nstep=50,save_data=True,vtype='RD',method='S',run=ONRGFC))
+        dname=din+'/'+a.name.full+'_GFC/'
+        a.runapps('GFC')
+        gse,coeff=a.apps['GFC'].gse,array(a.apps['GFC'].coeff)
+        if not os.path.isfile(dname+'meta.npz'):
+            raise ValueError("Test_onr_gfc_store error: the store is not written on the first run.")
+        done=open_memmap(dname+'done.npy',mode='r+')
+        done[0,0,0]=False
+        del done
+        buff=open_memmap(dname+'coeff.npy',mode='r+')
+        buff[0,0,0]=0
+        del buff
+        a.runapps('GFC')
+        if abs(a.apps['GFC'].gse-gse)>RZERO or abs(array(a.apps['GFC'].coeff)-coeff).max()>10**-8:
+            raise ValueError("Test_onr_gfc_store error: the resumed coefficients differ from the original ones.")
+        a.apps['GFC'].nstep=40
+        a.runapps('GFC')
+        fin=load(dname+'meta.npz')
+        nstep=fin['nstep'][()]
+        fin.close()
+        if nstep!=40 or load(dname+'coeff.npy',mmap_mode='r').shape[-1]!=40:
+            raise ValueError("Test_onr_gfc_store error: the store is not rebuilt after the parameters are changed.")
+    finally:
+        shutil.rmtree(din)
+
+def test_onr_matrix_cache():
+    m=2;n=2
+    p1=Point(scope='WG'+str(m)+str(n),site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(atom=0,norbital=1,nspin=2,nnambu=1))
+    a1=array([1.0,0.0])
+    a2=array([0.0,1.0])
+    a=ONR(
+            name=       'WG'+str(m)+str(n),
+            ensemble=   'c',
+            filling=    0.5,
+            mu=         2.0,
+            basis=      BasisE(up=(m*n,m*n/2),down=(m*n,m*n/2)),
+            nspin=      2,
+            lattice=    Lattice(name='WG'+str(m)+str(n),points=[p1],translations=[(a1,m),(a2,n)]),
+            terms=[     Hopping('t',-1.0,neighbour=1,modulate=lambda **karg:karg['t']),
+                        Hubbard('U',4.0)
+                        ]
+        )
+    for t in (-1.0,0.6+0.8j,-0.3-0.2j):
+        a.update(t=t)
+        a.set_matrix(cache=True)
+        buff=opts_rep(a.operators['h'],a.basis,dtype=complex128)
+        print 't=%s, difference:'%t,abs(a.matrix-buff).max(),abs(a.matrix-a.matrix.T.conjugate()).max()
+        if abs(a.matrix-buff).max()>RZERO or abs(a.matrix-a.matrix.T.conjugate()).max()>RZERO:
+            raise ValueError("Test_onr_matrix_cache error: the cached matrix differs from the rebuilt one.")
+    a.set_matrix()
+    if 'matrix' in a.cache:
+        raise ValueError("Test_onr_matrix_cache error: the cache is not released when it is not requested.")
+
+def test_onr_sectors():
+    m=4
+    p1=Point(scope='WG'+str(m),site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(atom=0,norbital=1,nspin=2,nnambu=1))
+    a1=array([1.0,0.0])
+    for symmetry,spinflip,particlehole in ((True,None,None),(True,'auto',None),(False,'auto','auto'),(True,'auto','auto')):
+        a=ONR(
+                name=       'WG'+str(m),
+                ensemble=   'c',
+                filling=    0.5,
+                mu=         2.0,
+                basis=      BasisE(up=(m,m/2),down=(m,m/2)),
+                nspin=      2,
+                lattice=    Lattice(name='WG'+str(m),points=[p1],translations=[(a1,m)],vectors=[a1*m]),
+                terms=[     Hopping('t',-1.0,neighbour=1),
+                            Hubbard('U',4.0)
+                            ],
+                symmetry=   symmetry,
+                spinflip=   spinflip,
+                particlehole=particlehole
+            )
+        perms,holes,irreps=a.symmetry_group()
+        es=[]
+        for label,chars in irreps:
+            a.sector=SymmetricBasisE(a.basis,perms,chars,holes)
+            if a.sector.nbasis==0: continue
+            a.set_matrix()
+            es.extend(eigh(a.matrix.toarray(),eigvals_only=True))
+        a.sector=None
+        a.set_matrix()
+        full=eigh(a.matrix.toarray(),eigvals_only=True)
+        print 'symmetry=%s, spinflip=%s, particlehole=%s, difference:'%(symmetry,spinflip,particlehole),abs(sort(es)-full).max() if len(es)==len(full) else inf
+        if len(es)!=len(full) or abs(sort(es)-full).max()>10**-8:
+            raise ValueError("Test_onr_sectors error: the sector spectra do not add up to the full spectrum.")
+        a.addapps(app=GFC(nstep=20,save_data=False,vtype='RD',method='S',run=ONRGFC))
+        a.runapps('GFC')
+        if a.sector is not None:
+            raise ValueError("Test_onr_sectors error: the sector is not reset after ONRGFC.")
+    a=ONR(
+            name=       'WG'+str(m),
+            ensemble=   'c',
+            filling=    0.5,
+            mu=         2.0,
+            basis=      BasisE(up=(m,m/2),down=(m,m/2)),
+            nspin=      2,
+            lattice=    Lattice(name='WG'+str(m),points=[p1],translations=[(a1,m)],vectors=[a1*m],nneighbour=2),
+            terms=[     Hopping('t',-1.0,neighbour=1),
+                        Hopping('tp',-0.3,neighbour=2),
+                        Hubbard('U',4.0)
+                        ],
+            particlehole='auto'
+        )
+    try:
+        a.symmetry_group()
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Test_onr_sectors error: the broken particle-hole symmetry is not detected.")
+
+def test_onr_gfc_methods():
+    m=2;n=2
+    p1=Point(scope='WG'+str(m)+str(n),site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(atom=0,norbital=1,nspin=2,nnambu=1))
+    a1=array([1.0,0.0])
+    a2=array([0.0,1.0])
+    a=ONR(
+            name=       'WG'+str(m)+str(n),
+            ensemble=   'c',
+            filling=    0.5,
+            mu=         2.0,
+            basis=      BasisE(up=(m*n,m*n/2),down=(m*n,m*n/2)),
+            nspin=      2,
+            lattice=    Lattice(name='WG'+str(m)+str(n),points=[p1],translations=[(a1,m),(a2,n)]),
+            terms=[     Hopping('t',-1.0,neighbour=1),
+                        Hubbard('U',4.0)
+                        ]
+        )
+    omegas=array([0.5+0.3j,-1.2+0.1j,2.0+0.5j])+a.mu
+    gfs={}
+    for method in ('S','B','Q'):
+        a.addapps(app=GFC(nstep=40,save_data=False,vtype='RD',method=method,run=ONRGFC))
+        a.runapps('GFC')
+        gfs[method]=array([copy(a.gf(omega)) for omega in omegas])
+    for method,gf in gfs.iteritems():
+        print 'method=%s, difference:'%method,abs(gf-gfs['S']).max()
+        if abs(gf-gfs['S']).max()>10**-6:
+            raise ValueError("Test_onr_gfc_methods error: the Green's functions of the method %s and 'S' differ."%method)
+
+def test_onr_gf_batch():
+    m=2;n=2
+    p1=Point(scope='WG'+str(m)+str(n),site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(atom=0,norbital=1,nspin=2,nnambu=1))
+    a1=array([1.0,0.0])
+    a2=array([0.0,1.0])
+    a=ONR(
+            name=       'WG'+str(m)+str(n),
+            ensemble=   'c',
+            filling=    0.5,
+            mu=         2.0,
+            basis=      BasisE(up=(m*n,m*n/2),down=(m*n,m*n/2)),
+            nspin=      2,
+            lattice=    Lattice(name='WG'+str(m)+str(n),points=[p1],translations=[(a1,m),(a2,n)]),
+            terms=[     Hopping('t',-1.0,neighbour=1),
+                        Hubbard('U',4.0)
+                        ]
+        )
+    omegas=linspace(-4.0,4.0,7)+a.mu+0.05j
+    for method in ('S','B','Q'):
+        a.addapps(app=GFC(nstep=40,save_data=False,vtype='RD',method=method,run=ONRGFC))
+        a.runapps('GFC')
+        batch=copy(a.gf(omegas))
+        stack=array([copy(a.gf(omega)) for omega in omegas])
+        print 'method=%s, difference:'%method,abs(batch-stack).max()
+        if batch.shape!=stack.shape or abs(batch-stack).max()>RZERO:
+            raise ValueError("Test_onr_gf_batch error: the batched Green's functions of the method %s differ from the stacked ones."%method)
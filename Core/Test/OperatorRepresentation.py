@@ -1,6 +1,7 @@
 from Hamiltonian.Core.BasicClass.OperatorRepresentationPy import *
 from Hamiltonian.Core.BasicClass.QuadraticPy import *
 from Hamiltonian.Core.BasicClass.LatticePy import *
+from numpy.random import RandomState
 import time
 def test_opt_rep():
     m=2;n=2;nloop=500
@@ -28,3 +29,138 @@ def test_opt_rep():
 #        print opt_rep(opts[0],basis,transpose=False)
     etime=time.time()
     print etime-stime
+    test_opts_rep(a,b,l,table)
+    test_opts_rep_parity(a,c,l,table)
+    test_opts_dtype(l,table)
+    test_sign()
+
+def test_opts_rep(a,b,l,table):
+    opts=OperatorList()
+    for bond in l.bonds:
+        opts.extend(a.operators(bond,table))
+        opts.extend(b.operators(bond,table))
+    basis=BasisE(nstate=len(table))
+    stime=time.time()
+    m1=opts_rep(opts,basis)
+    etime=time.time()
+    print 'opts_rep:',etime-stime
+    stime=time.time()
+    m2=csr_matrix((basis.nbasis,basis.nbasis),dtype=complex128)
+    for opt in opts:
+        m2+=opt_rep(opt,basis,transpose=False)
+    m2=transpose(m2+conjugate(transpose(m2)))
+    etime=time.time()
+    print 'opt_rep:',etime-stime
+    print 'difference:',abs(m1-m2).max()
+
+def test_opts_rep_parity(a,c,l,table):
+    opts=OperatorList()
+    for bond in l.bonds:
+        opts.extend(a.operators(bond,table))
+        opts.extend(c.operators(bond,table))
+    basis=BasisE(nstate=len(table))
+    stime=time.time()
+    m=opts_rep(opts,basis)
+    etime=time.time()
+    print 'opts_rep on EG:',etime-stime
+    stime=time.time()
+    ms=[opts_rep(opts,BasisE(nstate=len(table),parity=parity)) for parity in (0,1)]
+    etime=time.time()
+    print 'opts_rep on the parity sectors of EG:',etime-stime
+    print 'difference:',abs(sum(abs(m.data)**2)-sum([sum(abs(buff.data)**2) for buff in ms])),m.nnz-sum([buff.nnz for buff in ms])
+
+def test_opts_dtype(l,table):
+    a=QuadraticList(Hopping('t',0.6+0.8j,neighbour=1,indexpackages=sigmaz("SP")))
+    b=QuadraticList(Onsite('mu',1.0,neighbour=0,indexpackages=sigmaz("SP")))
+    opts=OperatorList()
+    for bond in l.bonds:
+        opts.extend(a.operators(bond,table))
+        opts.extend(b.operators(bond,table))
+    basis=BasisE(nstate=len(table))
+    if opts_dtype(opts)!=complex128 or opts_dtype([opt for opt in opts if abs(imag(opt.value))<RZERO])!=float64:
+        raise ValueError("Test_opts_dtype error: the data type of the operators is wrong.")
+    m1=opts_rep(opts,basis,dtype=opts_dtype(opts))
+    m2=opts_rep(opts,basis,dtype=complex128)
+    v=exp(1j*arange(basis.nbasis))
+    m3=opts_linear_operator(opts,basis,dtype=opts_dtype(opts))
+    print 'complex hoppings, difference:',abs(m1-m2).max(),norm(m3.matvec(v)-m2.dot(v))
+    if abs(m1-m2).max()>RZERO or norm(m3.matvec(v)-m2.dot(v))>10**-8:
+        raise ValueError("Test_opts_dtype error: the imaginary parts of the coefficients are lost.")
+
+def test_sign():
+    nstate,nparticle,npair,nloop=40,3,20,5
+    rs=RandomState(0)
+    basis=BasisE((nstate,nparticle))
+    nbasis,basis_table,rank_table,rank_info=basis.nbasis,basis.basis_table,basis.rank_table,basis.rank_info
+    pairs=[rs.choice(nstate,size=2,replace=False) for i in xrange(npair)]
+    results,times={},{}
+    for name,kernel in (('opt_rep_2_10',opt_rep_2_10),('per-bit loop',opt_rep_2_10_loop)):
+        buff=[(zeros(nbasis,dtype=complex128),zeros(nbasis,dtype=index_dtype(nbasis)),zeros(nbasis+1,dtype=index_dtype(nbasis))) for seq1,seq2 in pairs]
+        kernel(buff[0][0],buff[0][1],buff[0][2],nbasis,basis_table,rank_table,rank_info,pairs[0][0],pairs[0][1])
+        stime=time.time()
+        for i in xrange(nloop):
+            for (data,indices,indptr),(seq1,seq2) in zip(buff,pairs):
+                kernel(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2)
+        etime=time.time()
+        results[name],times[name]=buff,(etime-stime)/nloop/npair/nbasis
+        print '%s: %.3e s per basis state'%(name,times[name])
+    for a,b in zip(results['opt_rep_2_10'],results['per-bit loop']):
+        if any([not array_equal(x,y) for x,y in zip(a,b)]):
+            raise ValueError("Test_sign error: the matrices from the popcount kernel and from the per-bit loop differ.")
+    reps=array([basis_rep(i,basis_table,rank_info) for i in xrange(nbasis)],dtype=int64)
+    seqs=array([rs.choice(nstate,size=4,replace=False) for i in xrange(npair)],dtype=int64)
+    nambus=array([[CREATION,CREATION,ANNIHILATION,ANNIHILATION]]*npair,dtype=int64)
+    for name,kernel in (('opt_act',opts_act_popcount),('per-bit loop',opts_act_loop)):
+        kernel(reps,seqs,nambus)
+        stime=time.time()
+        for i in xrange(nloop):
+            results[name]=kernel(reps,seqs,nambus)
+        etime=time.time()
+        print '%s: %.3e s per basis state'%(name,(etime-stime)/nloop/npair/nbasis)
+    if not array_equal(results['opt_act'],results['per-bit loop']):
+        raise ValueError("Test_sign error: the signs from opt_act and from the per-bit loop differ.")
+
+@jit
+def opt_rep_2_10_loop(data,indices,indptr,nbasis,basis_table,rank_table,rank_info,seq1,seq2):
+    ndata=0
+    for i in xrange(nbasis):
+        indptr[i]=ndata
+        rep=basis_rep(i,basis_table,rank_info)
+        if rep&1<<seq2:
+            rep1=rep&~(1<<seq2)
+            if not rep1&(1<<seq1):
+                nsign=0
+                for j in xrange(seq2):
+                    if rep&1<<j: nsign+=1
+                for j in xrange(seq1):
+                    if rep1&1<<j: nsign+=1
+                rep2=rep1|1<<seq1
+                indices[ndata]=seq_basis_rank(rep2,basis_table,rank_table,rank_info)
+                data[ndata]=(-1)**nsign
+                ndata+=1
+    indptr[nbasis]=ndata
+
+@jit
+def opts_act_popcount(reps,seqs,nambus):
+    result=zeros((seqs.shape[0],reps.shape[0],2),dtype=int64)
+    for n in xrange(seqs.shape[0]):
+        for i in xrange(reps.shape[0]):
+            result[n,i,0],result[n,i,1]=opt_act(reps[i],seqs.shape[1],seqs[n],nambus[n])
+    return result
+
+@jit
+def opts_act_loop(reps,seqs,nambus):
+    result=zeros((seqs.shape[0],reps.shape[0],2),dtype=int64)
+    for n in xrange(seqs.shape[0]):
+        for i in xrange(reps.shape[0]):
+            rep,sign=reps[i],1
+            for k in xrange(seqs.shape[1]-1,-1,-1):
+                seq=seqs[n,k]
+                if (nambus[n,k]==CREATION)==(rep&1<<seq!=0):
+                    sign=0
+                    break
+                for j in xrange(seq):
+                    if rep&1<<j: sign=-sign
+                rep=rep^(1<<seq)
+            result[n,i,0],result[n,i,1]=rep,sign
+    return result
@@ -2,6 +2,10 @@ from Hamiltonian.Core.CoreAlgorithm.VCAPy import *
 from Hamiltonian.Core.BasicClass.LatticePy import *
 from Hamiltonian.Core.BasicClass.BaseSpacePy import *
 def test_vca():
+    test_vca_body()
+    test_vca_gp()
+
+def test_vca_body():
     U=8.0
     t=-1.0
     m=2;n=2
@@ -33,3 +37,38 @@ def test_vca():
     a.addapps('FS',FS(BZ=square_bz(nk=100),save_data=False,run=VCAFS))
     #a.addapps('CP',CP(BZ=square_bz(nk=100),eta=0.01,a=0,b=U,run=VCACP))
     a.runapps()
+
+def test_vca_gp():
+    U=4.0
+    t=-1.0
+    m=2;n=2
+    p1=Point(scope='WG'+str(m)+str(n),site=0,rcoord=[0.0,0.0],icoord=[0.0,0.0],struct=Fermi(atom=0,norbital=1,nspin=2,nnambu=1))
+    a1=array([1.0,0.0])
+    a2=array([0.0,1.0])
+    a=VCA(
+            name=       'WG'+str(m)+str(n),
+            ensemble=   'c',
+            filling=    0.5,
+            mu=         U/2,
+            basis=      BasisE(up=(m*n,m*n/2),down=(m*n,m*n/2)),
+            #basis=      BasisE((2*m*n,m*n)),
+            nspin=      1,
+            cell=       Lattice(name='WG',points=[p1],vectors=[a1,a2]),
+            lattice=    Lattice(name='WG'+str(m)+str(n),points=[p1],translations=[(a1,m),(a2,n)],vectors=[a1*m,a2*n]),
+            terms=[     Hopping('t',t,neighbour=1),
+                        Hubbard('U',U)
+                        ],
+            nambu=      False,
+            weiss=[     Onsite('afm',0.0,indexpackages=sigmaz('sp'),amplitude=lambda bond: 1 if bond.spoint.site in (0,3) else -1,modulate=lambda **karg:karg['afm'])]
+            )
+    a.update(afm=0.1)
+    gps={}
+    for method in ('Q','S'):
+        a.addapps('GFC',GFC(nstep=40,save_data=False,vtype='RD',method=method,run=ONRGFC))
+        a.addapps('GP',GP(BZ=square_bz(reciprocals=a.lattice.reciprocals,nk=8),run=VCAGP))
+        a.runapps('GFC')
+        a.runapps('GP')
+        gps[method]=a.apps['GP'].gp
+    print 'pole sum: %s, quad: %s, difference: %s'%(gps['Q'],gps['S'],abs(gps['Q']-gps['S']))
+    if abs(gps['Q']-gps['S'])>10**-5:
+        raise ValueError("Test_vca_gp error: the pole sum of the grand potential differs from the quad integral.")
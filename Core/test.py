@@ -45,6 +45,9 @@ for arg in sys.argv:
     if arg in ('lanczos','all'):
         from Test.Lanczos import *
         test_lanczos()
+    if arg in ('mixer','all'):
+        from Test.Mixer import *
+        test_mixer()
     if arg in ('tba','all'):
         from Test.TBA import *
         test_tba()